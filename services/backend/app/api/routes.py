@@ -1,105 +1,303 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
-from sqlalchemy.orm import Session
-from typing import List, Optional, Dict, Any
-import traceback
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Literal, Optional, Dict, Any
+import logging
 import asyncio
-from sqlalchemy import func
-import json
+import hashlib
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+import orjson
 
-from app.core.config import settings, Settings
-from app.db.session import get_db, SessionLocal
+from app.core.config import get_settings, settings, Settings
+from app.db.session import get_db, AsyncSessionLocal
 from app.models.pixel import Pixel
 from app.models.transaction import Transaction
 from app.models.wallet_balance import WalletBalance
 from app.services.kasware import kasware_service, KasWareService
-from app.schemas import TransactionVerification, TransactionMetrics
+from app.services.scheduler import verification_scheduler
+from app.schemas import TransactionVerification, TransactionMetrics, PixelBatchPlacement, COLOR_PATTERN
 from app.websockets import manager as connection_manager
+from app.websockets.canvas import pack_color
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
-# connection_manager = ConnectionManager()  # Remove this line as we're importing the manager from main.py
+
+# Pre-built query statements. Building them once at import time lets SQLAlchemy
+# reuse the cached compiled SQL instead of constructing a new expression per request.
+_SEL_PIXELS = select(
+    Pixel.id, Pixel.x, Pixel.y, Pixel.color,
+    Pixel.wallet_address, Pixel.transaction_id, Pixel.created_at
+)
+_SEL_TX_BY_ID = select(Transaction).where(Transaction.transaction_id == bindparam("tx_id"))
+# Total pixels and number of verified purchases for a wallet, summed in the database.
+# Matches the address case-insensitively like _SEL_WALLET_CI; pass the lowercased address
+_SUM_VERIFIED_TXS = select(
+    func.coalesce(func.sum(Transaction.pixels_added), 0),
+    func.count()
+).where(
+    func.lower(Transaction.wallet_address) == bindparam("addr"),
+    Transaction.verified == True
+)
+_SEL_WALLET = select(WalletBalance).where(WalletBalance.wallet_address == bindparam("addr"))
+# Case-insensitive lookup, served by the lower(wallet_address) index; pass the lowercased address
+_SEL_WALLET_CI = select(WalletBalance).where(
+    func.lower(WalletBalance.wallet_address) == bindparam("addr")
+)
+_SEL_WALLET_CI_FOR_UPDATE = _SEL_WALLET_CI.with_for_update()
+_SEL_WALLET_BALANCE_CI = select(WalletBalance.pixel_balance).where(
+    func.lower(WalletBalance.wallet_address) == bindparam("addr")
+)
+# Flip transactions to verified exactly once; returns no row for those already verified
+_MARK_TXS_VERIFIED = (
+    update(Transaction)
+    .where(Transaction.transaction_id.in_(bindparam("tx_ids", expanding=True)), Transaction.verified == False)
+    .values(verified=True)
+    .returning(Transaction.transaction_id, Transaction.wallet_address, Transaction.pixels_added)
+    .execution_options(synchronize_session=False)
+)
+# Spend pixels only if the wallet can afford them; returns no row otherwise
+_SPEND_PIXELS = (
+    update(WalletBalance)
+    .where(
+        WalletBalance.wallet_address == bindparam("addr"),
+        WalletBalance.pixel_balance >= bindparam("count")
+    )
+    .values(
+        pixel_balance=WalletBalance.pixel_balance - bindparam("count"),
+        pixels_spent=WalletBalance.pixels_spent + bindparam("count")
+    )
+    .returning(WalletBalance.pixel_balance)
+    .execution_options(synchronize_session=False)
+)
+# Place pixels, replacing whatever was in the cell before; RETURNING hands back id and timestamp
+_ins_pixels = pg_insert(Pixel)
+_UPSERT_PIXELS = _ins_pixels.on_conflict_do_update(
+    index_elements=[Pixel.x, Pixel.y],
+    set_={
+        "color": _ins_pixels.excluded.color,
+        "wallet_address": _ins_pixels.excluded.wallet_address,
+        "transaction_id": _ins_pixels.excluded.transaction_id,
+        "created_at": func.now(),
+    },
+).returning(
+    Pixel.id, Pixel.x, Pixel.y, Pixel.color,
+    Pixel.wallet_address, Pixel.transaction_id, Pixel.created_at
+)
+# Set a wallet's balance to the pixels it purchased, creating the row if a concurrent request
+# hasn't already; an existing row keeps what it has spent deducted
+_ins_wallet = pg_insert(WalletBalance).values(
+    wallet_address=bindparam("addr"), pixel_balance=bindparam("pixels")
+)
+_UPSERT_WALLET_SET = _ins_wallet.on_conflict_do_update(
+    index_elements=[WalletBalance.wallet_address],
+    set_={
+        "pixel_balance": func.greatest(_ins_wallet.excluded.pixel_balance - WalletBalance.pixels_spent, 0),
+        "last_updated": func.now(),
+    },
+).returning(WalletBalance.pixel_balance)
+
+# Most pixel rows returned by one GET /pixels page
+PIXELS_PAGE_SIZE = 1000
+
+# Encoded /pixels response, tagged with the canvas version it was built from
+_pixels_cache: Dict[str, Any] = {"body": None, "etag": None}
+
+# Public configuration for the frontend; settings don't change while the app is running
+PUBLIC_CONFIG = {
+    "canvas_width": settings.CANVAS_WIDTH,
+    "canvas_height": settings.CANVAS_HEIGHT,
+    "pixel_pack_cost": settings.PIXEL_PACK_COST,
+    "pixel_pack_cost_sompi": settings.PIXEL_PACK_COST_SOMPI,
+    "pixel_pack_size": settings.PIXEL_PACK_SIZE,
+    "receiver_address": settings.RECEIVER_ADDRESS,
+    "verify_transactions": settings.enable_transaction_verification,
+    "transaction_check_interval": settings.TRANSACTION_CHECK_INTERVAL
+}
+PUBLIC_CONFIG_BODY = orjson.dumps(PUBLIC_CONFIG)
+PUBLIC_CONFIG_ETAG = '"%s"' % hashlib.blake2b(PUBLIC_CONFIG_BODY, digest_size=8).hexdigest()
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """
+    True if the request's If-None-Match header already names this ETag.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in (tag.strip() for tag in if_none_match.split(","))
+
+def _clean_tx_id(transaction_id: str) -> str:
+    """
+    Strip whitespace and quotes from a transaction ID. JSON-wrapped IDs are
+    rejected; clients must send the bare ID.
+    """
+    transaction_id = transaction_id.strip().strip('"\'')
+    if not transaction_id or transaction_id.startswith("{"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid transaction ID"
+        )
+    return transaction_id
 
 # Dependency to get the KasWareService instance
 def get_kasware_service() -> KasWareService:
     return kasware_service
 
-# Dependency to get the Settings instance
-def get_settings() -> Settings:
-    return settings
-
-@router.get("/pixels", response_model=List[dict])
-async def get_pixels(db: Session = Depends(get_db)):
-    """
-    Get all pixels from the database.
-    """
-    pixels = db.query(Pixel).all()
-    return [
-        {
-            "id": pixel.id,
-            "x": pixel.x,
-            "y": pixel.y,
-            "color": pixel.color,
-            "wallet_address": pixel.wallet_address,
-            "transaction_id": pixel.transaction_id,
-            "created_at": pixel.created_at
-        }
-        for pixel in pixels
-    ]
-
-async def verify_transaction_in_background(transaction_id: str):
+@router.get("/pixels")
+async def get_pixels(
+    request: Request,
+    x0: Optional[int] = Query(None, ge=0, description="Left edge of the bounding box (inclusive)"),
+    y0: Optional[int] = Query(None, ge=0, description="Top edge of the bounding box (inclusive)"),
+    x1: Optional[int] = Query(None, ge=0, description="Right edge of the bounding box (inclusive)"),
+    y1: Optional[int] = Query(None, ge=0, description="Bottom edge of the bounding box (inclusive)"),
+    since: Optional[int] = Query(None, ge=0, description="Paging cursor: return rows with an id above this (the last id of the previous page)"),
+    limit: int = Query(PIXELS_PAGE_SIZE, ge=1, le=PIXELS_PAGE_SIZE, description="Most rows to return"),
+    db: AsyncSession = Depends(get_db)
+):
     """
-    Background task to verify transaction in the blockchain.
+    Get pixels.
+    Without filters this returns the current color of every painted pixel from the
+    in-memory canvas, re-encoded only when the canvas changes. That canvas holds only
+    pixels placed through the paid routes (it mirrors the database), and each entry is
+    just {"x", "y", "color"}; use the filtered form below for id, wallet_address,
+    transaction_id and created_at. With a bounding box
+    (x0, y0, x1, y1, inclusive) or a `since` cursor it pages through the stored
+    pixels in id order; pass the last id of a page as `since` to get the next one.
+    The database keeps only the latest pixel per cell, so these are the cells'
+    current pixels, not a history of placements. Repainting a cell keeps its row id,
+    so `since` is a paging cursor rather than a feed of changes.
     """
-    # Start monitoring for transaction confirmation
-    await kasware_service.start_transaction_timer(transaction_id)
+    if x0 is None and y0 is None and x1 is None and y1 is None and since is None:
+        canvas = connection_manager.canvas
+        etag = f'"{canvas.etag}-pixels"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if _etag_matches(request, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        
+        # Re-encode only when the canvas has changed since the cached body was built
+        if _pixels_cache["etag"] != etag:
+            _pixels_cache["body"] = orjson.dumps(canvas.to_list())
+            _pixels_cache["etag"] = etag
+        
+        return Response(content=_pixels_cache["body"], media_type="application/json", headers=headers)
     
-    # Initial verification attempt
-    verification_result = await kasware_service.verify_transaction_in_blockchain(transaction_id)
+    query = _SEL_PIXELS
+    if x0 is not None:
+        query = query.where(Pixel.x >= x0)
+    if x1 is not None:
+        query = query.where(Pixel.x <= x1)
+    if y0 is not None:
+        query = query.where(Pixel.y >= y0)
+    if y1 is not None:
+        query = query.where(Pixel.y <= y1)
+    if since is not None:
+        query = query.where(Pixel.id > since)
+    query = query.order_by(Pixel.id).limit(limit)
     
-    # If not verified, we'll let the frontend poll for updates
-    return verification_result
+    # Fetch plain column tuples rather than ORM objects and encode them with orjson
+    rows = (await db.execute(query)).all()
+    return Response(content=orjson.dumps([row._asdict() for row in rows]), media_type="application/json")
+
+# Verified transactions waiting to be credited, resolved with the wallet's new balance
+# (or None if the transaction was already verified). Confirmations that land within
+# CREDIT_BATCH_WINDOW_MS of each other are credited in a single database transaction.
+CREDIT_BATCH_WINDOW_MS = 10
+_pending_credits: Dict[str, asyncio.Future] = {}
+_credit_flush: Optional[asyncio.Task] = None
+
+async def _credit_verified_transaction(transaction_id: str) -> Optional[int]:
+    """
+    Mark a transaction verified and credit its wallet, batched with any other
+    transactions confirmed at the same time.
+    """
+    global _credit_flush
+    future = _pending_credits.get(transaction_id)
+    if future is None:
+        future = _pending_credits[transaction_id] = asyncio.get_running_loop().create_future()
+    if _credit_flush is None or _credit_flush.done():
+        _credit_flush = asyncio.create_task(_flush_credits())
+    # Shield so one cancelled waiter doesn't cancel the result for the others
+    return await asyncio.shield(future)
+
+async def _flush_credits():
+    while _pending_credits:
+        # Wait briefly so confirmations from concurrent verification jobs join this batch;
+        # a confirmation arriving later starts the next one
+        await asyncio.sleep(CREDIT_BATCH_WINDOW_MS / 1000)
+        batch = dict(_pending_credits)
+        _pending_credits.clear()
+        try:
+            # The guarded UPDATE locks the transaction rows and matches only unverified ones,
+            # so concurrent verifications of the same transaction credit the wallet once
+            async with AsyncSessionLocal() as db, db.begin():
+                marked = (await db.execute(_MARK_TXS_VERIFIED, {"tx_ids": list(batch)})).all()
+                credits: Dict[str, int] = {}
+                for row in marked:
+                    credits[row.wallet_address] = credits.get(row.wallet_address, 0) + row.pixels_added
+                balances: Dict[str, int] = {}
+                if credits:
+                    ins = pg_insert(WalletBalance).values([
+                        {"wallet_address": addr, "pixel_balance": pixels}
+                        # Sorted so concurrent workers lock wallet rows in the same order
+                        for addr, pixels in sorted(credits.items())
+                    ])
+                    upsert = ins.on_conflict_do_update(
+                        index_elements=[WalletBalance.wallet_address],
+                        set_={
+                            "pixel_balance": WalletBalance.pixel_balance + ins.excluded.pixel_balance,
+                            "last_updated": func.now(),
+                        },
+                    ).returning(WalletBalance.wallet_address, WalletBalance.pixel_balance)
+                    balances = dict((await db.execute(upsert)).tuples().all())
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            continue
+        
+        credited = {row.transaction_id: balances[row.wallet_address] for row in marked}
+        for tx_id, future in batch.items():
+            if not future.done():
+                future.set_result(credited.get(tx_id))
 
-async def verify_transaction_and_update_balance(transaction_id: str, db: Session = None):
+class TransactionNotConfirmed(Exception):
+    """
+    A purchase wasn't confirmed within one verification job; the scheduler retries it.
+    """
+
+async def verify_transaction_and_update_balance(transaction_id: str):
     """
     Verify a transaction and update the wallet balance if valid.
     This function is used for purchase transactions to ensure pixels are only
     added to a wallet's balance after the transaction is confirmed on the blockchain.
+    It raises when the transaction isn't confirmed yet or verification fails, so the
+    verification scheduler retries it with backoff (up to VERIFY_MAX_RETRIES times).
     
-    Note: This function creates its own database session if one is not provided,
-    which is important for background tasks that run after the request is completed.
+    Note: This function always opens its own database sessions, since it runs
+    as a background task after the request (and its session) has completed.
+    No database connection is held while polling the Kaspa API.
     """
-    print(f"=======================================")
-    print(f"Starting verification and balance update for transaction {transaction_id}")
-    
-    # Create a new database session if one wasn't provided
-    if db is None:
-        from app.db.session import SessionLocal
-        db = SessionLocal()
-        print(f"Created new database session for background verification")
-        own_session = True
-    else:
-        own_session = False
+    logger.debug("Starting verification and balance update for transaction %s", transaction_id)
     
     try:
-        # Get the transaction from the database
-        transaction = db.query(Transaction).filter(
-            Transaction.transaction_id == transaction_id
-        ).first()
+        # Use a dedicated session: the request-scoped session is closed once the response is sent.
+        # Close it again before polling so the connection goes back to the pool.
+        async with AsyncSessionLocal() as db:
+            transaction = (await db.execute(
+                _SEL_TX_BY_ID, {"tx_id": transaction_id}
+            )).scalars().first()
         
         if not transaction:
-            print(f"Transaction {transaction_id} not found in database")
-            if own_session:
-                db.close()
-                print(f"Closed database session")
+            logger.debug("Transaction %s not found in database", transaction_id)
             return
-            
+        
         if transaction.verified:
-            print(f"Transaction {transaction_id} already verified")
-            if own_session:
-                db.close()
-                print(f"Closed database session")
+            logger.debug("Transaction %s already verified", transaction_id)
             return
         
-        print(f"Found transaction in database: {transaction.transaction_id}, wallet: {transaction.wallet_address}, pixels to add: {transaction.pixels_added}")
+        logger.debug("Found transaction in database: %s, wallet: %s, pixels to add: %s", transaction.transaction_id, transaction.wallet_address, transaction.pixels_added)
         
         # Start monitoring for transaction confirmation
         await kasware_service.start_transaction_timer(transaction_id)
@@ -113,238 +311,215 @@ async def verify_transaction_and_update_balance(transaction_id: str, db: Session
         # This involves multiple attempts with delays between them
         while attempt < max_attempts and not verified:
             attempt += 1
-            print(f"Verification attempt {attempt} for transaction {transaction_id}")
+            logger.debug("Verification attempt %s for transaction %s", attempt, transaction_id)
             
             # Verify the transaction
             verification_result = await kasware_service.verify_transaction_in_blockchain(transaction_id)
             verified = verification_result.get("verified", False)
             
             if verified:
-                print(f"Transaction {transaction_id} verified on attempt {attempt}")
+                logger.debug("Transaction %s verified on attempt %s", transaction_id, attempt)
                 break
-                
-            # Wait before trying again (200ms)
-            await asyncio.sleep(0.2)
-        
-        if verified:
-            print(f"TRANSACTION VERIFIED: {transaction_id} - Now updating wallet balance for {transaction.wallet_address}")
-            # Transaction is valid, update the wallet balance
-            try:
-                # Debug: Print all wallet balances in database
-                all_balances = db.query(WalletBalance).all()
-                print(f"All wallet balances before update:")
-                for balance in all_balances:
-                    print(f"  - {balance.wallet_address}: {balance.pixel_balance}")
-                
-                # First, directly check if the wallet exists with a case-sensitive query
-                wallet_balance = db.query(WalletBalance).filter(
-                    WalletBalance.wallet_address == transaction.wallet_address
-                ).first()
-                
-                if not wallet_balance:
-                    print(f"Creating new wallet balance for {transaction.wallet_address}")
-                    # Create the new wallet balance record
-                    wallet_balance = WalletBalance(
-                        wallet_address=transaction.wallet_address,
-                        pixel_balance=0
-                    )
-                    # Add it to the session and immediately flush to get the new ID
-                    db.add(wallet_balance)
-                    db.flush()
-                    print(f"Created new wallet balance with ID: {wallet_balance.id}")
-                    
-                    # Verify it was created correctly
-                    check_wallet = db.query(WalletBalance).filter(
-                        WalletBalance.wallet_address == transaction.wallet_address
-                    ).first()
-                    
-                    if check_wallet:
-                        print(f"Successfully created wallet balance: {check_wallet.wallet_address} with initial balance {check_wallet.pixel_balance}")
-                    else:
-                        print(f"WARNING: Failed to create wallet balance record!")
-                else:
-                    print(f"Found existing wallet balance for {transaction.wallet_address}: {wallet_balance.pixel_balance}")
-                
-                # Now it's safe to add the pixels - we have a wallet_balance record for sure
-                old_balance = wallet_balance.pixel_balance if wallet_balance else 0
-                wallet_balance.pixel_balance += transaction.pixels_added
-                print(f"Updated wallet balance from {old_balance} to {wallet_balance.pixel_balance} for {transaction.wallet_address}")
-                
-                # Mark transaction as verified
-                transaction.verified = True
-                
-                # Commit changes
-                db.commit()
-                print(f"Transaction {transaction_id} marked as verified and balance updated")
-                
-                # Debug: verify changes were committed
-                updated_balance = db.query(WalletBalance).filter(
-                    WalletBalance.wallet_address == transaction.wallet_address
-                ).first()
-                
-                if updated_balance:
-                    print(f"Verified balance after commit: {updated_balance.wallet_address} has {updated_balance.pixel_balance} pixels")
-                else:
-                    print(f"ERROR: Could not find wallet balance after commit")
-            except Exception as e:
-                print(f"ERROR updating wallet balance: {str(e)}")
-                import traceback
-                traceback.print_exc()
-        else:
-            print(f"Transaction {transaction_id} could not be verified after {max_attempts} attempts")
             
+            # Wait before trying again, backing off exponentially from 100ms up to 1s.
+            # Wake up early if another verification call confirms the transaction meanwhile.
+            if await kasware_service.wait_for_tx(transaction_id, timeout=min(1.0, 0.1 * 2 ** (attempt - 1))):
+                verified = True
+                logger.debug("Transaction %s confirmed while waiting after attempt %s", transaction_id, attempt)
+        
+        if not verified:
+            raise TransactionNotConfirmed(f"Transaction {transaction_id} not confirmed after {max_attempts} attempts")
+        
+        logger.info("Transaction %s verified - updating wallet balance for %s", transaction_id, transaction.wallet_address)
+        # Mark the transaction verified and credit the wallet in one short database transaction
+        new_balance = await _credit_verified_transaction(transaction_id)
+        if new_balance is None:
+            logger.warning("Transaction %s was already verified elsewhere", transaction_id)
+            return
+        
+        logger.info("Transaction %s marked as verified; %s now has %s pixels", transaction_id, transaction.wallet_address, new_balance)
+    except TransactionNotConfirmed:
+        raise
     except Exception as e:
-        # Log the error
-        print(f"Error verifying transaction {transaction_id}: {str(e)}")
-        import traceback
-        traceback.print_exc()
-    finally:
-        # Close the database session if we created it
-        if own_session:
-            db.close()
-            print(f"Closed database session")
-    
-    print(f"=======================================")
+        # Log the error and let the scheduler retry the job
+        logger.exception("Error verifying transaction %s: %s", transaction_id, e)
+        raise
 
 @router.post("/pixels", status_code=status.HTTP_201_CREATED)
 async def place_pixel(
-    x: int,
-    y: int,
-    color: str,
-    wallet_address: str,
-    transaction_id: str,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
+    x: int = Query(ge=0, lt=settings.CANVAS_WIDTH),
+    y: int = Query(ge=0, lt=settings.CANVAS_HEIGHT),
+    color: str = Query(pattern=COLOR_PATTERN),
+    wallet_address: str = Query(),
+    transaction_id: str = Query(),
+    db: AsyncSession = Depends(get_db),
     settings: Settings = Depends(get_settings)
 ):
     """
     Place a pixel on the canvas.
+    Coordinates and color format are validated by FastAPI before the handler runs.
     """
+    # Fully transparent colors pass the pattern but can't be stored on the canvas
     try:
-        # Validate coordinates
-        if not (0 <= x < settings.CANVAS_WIDTH and 0 <= y < settings.CANVAS_HEIGHT):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Invalid pixel coordinates"
-            )
-        
-        # Check if receiver address is configured
-        if not settings.RECEIVER_ADDRESS:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Receiver address not configured"
-            )
-        
-        # Check if the wallet has enough pixels
-        wallet_balance = db.query(WalletBalance).filter(WalletBalance.wallet_address == wallet_address).first()
-        
-        if not wallet_balance or wallet_balance.pixel_balance <= 0:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Insufficient pixel balance"
-            )
-        
-        # Decrement the wallet's pixel balance
-        wallet_balance.pixel_balance -= 1
-        
-        # Create new pixel
-        pixel = Pixel(
+        pack_color(color)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pixel color"
+        )
+    
+    # Check if receiver address is configured
+    if not settings.RECEIVER_ADDRESS:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Receiver address not configured"
+        )
+    
+    # Decrement the wallet's pixel balance, checking it can afford the pixel in the same statement
+    remaining_balance = (await db.execute(
+        _SPEND_PIXELS, {"addr": wallet_address, "count": 1}
+    )).scalar_one_or_none()
+    
+    if remaining_balance is None:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Insufficient pixel balance"
+        )
+    
+    # Write the pixel, overwriting the cell's previous one if any
+    try:
+        pixel = (await db.execute(_UPSERT_PIXELS.values(
             x=x,
             y=y,
             color=color,
             wallet_address=wallet_address,
             transaction_id=transaction_id
-        )
+        ))).one()
         
         # Save to database
-        db.add(pixel)
-        db.commit()
-        db.refresh(pixel)
-        
-        # Start transaction verification in the background if enabled
-        if settings.enable_transaction_verification:
-            background_tasks.add_task(verify_transaction_in_background, transaction_id)
-        
-        # Broadcast update to all connected clients
-        print(f"Broadcasting pixel update: x={x}, y={y}, color={color}")
-        
-        # Get active connections before broadcasting
-        active_connections = list(connection_manager.active_connections.keys())
-        print(f"Active connections before broadcast: {len(active_connections)}")
-        print(f"Active connection IDs: {active_connections}")
-        
-        # Broadcast the update
-        await connection_manager.broadcast_pixel_update(x, y, color)
-        
-        return {
-            "message": "Pixel placed successfully",
-            "pixel": {
-                "id": pixel.id,
-                "x": pixel.x,
-                "y": pixel.y,
-                "color": pixel.color,
-                "wallet_address": pixel.wallet_address,
-                "transaction_id": pixel.transaction_id,
-                "created_at": pixel.created_at
-            },
-            "remaining_balance": wallet_balance.pixel_balance
-        }
-    except HTTPException as e:
-        raise e
-    except Exception as e:
-        return {"error": str(e)}
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Duplicate transaction ID"
+        )
+    
+    # Queue the update for all connected clients without waiting on them
+    logger.debug("Broadcasting pixel update: x=%s, y=%s, color=%s", x, y, color)
+    connection_manager.enqueue_pixel_update(x, y, color)
+    
+    return {
+        "message": "Pixel placed successfully",
+        "pixel": pixel._asdict(),
+        "remaining_balance": remaining_balance
+    }
+
+@router.post("/pixels/batch", status_code=status.HTTP_201_CREATED)
+async def place_pixels_batch(
+    batch: PixelBatchPlacement,
+    db: AsyncSession = Depends(get_db),
+    settings: Settings = Depends(get_settings)
+):
+    """
+    Place several pixels on the canvas with one balance update, one multi-row
+    INSERT and one WebSocket message per client.
+    """
+    # Batch size, coordinates and color format are checked by the PixelBatchPlacement schema;
+    # fully transparent colors pass the pattern but can't be stored on the canvas
+    cells = set()
+    for p in batch.pixels:
+        try:
+            pack_color(p.color)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid pixel color"
+            )
+        # A single upsert can't write the same cell twice
+        if (p.x, p.y) in cells:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Duplicate pixel coordinates in batch"
+            )
+        cells.add((p.x, p.y))
+    
+    # Check if receiver address is configured
+    if not settings.RECEIVER_ADDRESS:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Receiver address not configured"
+        )
+    
+    # Spend the whole batch at once; nothing is placed if the wallet can't afford all of it
+    remaining_balance = (await db.execute(
+        _SPEND_PIXELS, {"addr": batch.wallet_address, "count": len(batch.pixels)}
+    )).scalar_one_or_none()
+    
+    if remaining_balance is None:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Insufficient pixel balance"
+        )
+    
+    try:
+        rows = (await db.execute(_UPSERT_PIXELS.values([
+            {
+                "x": p.x,
+                "y": p.y,
+                "color": p.color,
+                "wallet_address": batch.wallet_address,
+                "transaction_id": p.transaction_id
+            }
+            for p in batch.pixels
+        ]))).all()
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Duplicate transaction ID in batch"
+        )
+    
+    # Queue the whole batch as a single update for all connected clients
+    logger.debug("Broadcasting batch of %s pixels", len(rows))
+    connection_manager.enqueue_pixel_batch([(p.x, p.y, p.color) for p in batch.pixels])
+    
+    return {
+        "message": f"{len(rows)} pixels placed successfully",
+        "pixels": [row._asdict() for row in rows],
+        "remaining_balance": remaining_balance
+    }
 
 @router.get("/transactions/{transaction_id}/verify", response_model=TransactionVerification)
 async def verify_transaction(
     transaction_id: str,
     kasware_service: KasWareService = Depends(get_kasware_service),
-    settings: Settings = Depends(get_settings),
-    db: Session = Depends(get_db)
+    settings: Settings = Depends(get_settings)
 ):
     """
     Verify a transaction on the Kaspa blockchain.
+    A recorded purchase confirmed here is credited to its wallet the same way the
+    background verification does, so whichever sees the confirmation first credits it once.
     """
     # Check if transaction verification is enabled
     if not settings.enable_transaction_verification:
         return {"verified": False, "error": "Transaction verification is disabled"}
     
-    print(f"Received verification request for transaction ID: {transaction_id}")
-    
-    # Clean up transaction_id if it's a JSON string
-    original_tx_id = transaction_id
-    clean_tx_id = transaction_id
-    extracted_id = None
-    
-    if transaction_id.startswith('{') and transaction_id.endswith('}'):
-        try:
-            import json
-            tx_data = json.loads(transaction_id)
-            if 'id' in tx_data:
-                extracted_id = tx_data['id']
-                clean_tx_id = extracted_id
-                print(f"Extracted transaction ID from JSON: {extracted_id}")
-        except Exception as e:
-            print(f"Error parsing transaction ID as JSON: {e}")
-            # Continue with original ID if parsing fails
-    
-    # Strip any quotes or whitespace
-    clean_tx_id = clean_tx_id.strip().strip('"\'')
-    print(f"Cleaned transaction ID: {clean_tx_id}")
+    logger.debug("Received verification request for transaction ID: %s", transaction_id)
     
-    # Check if we have already processed this transaction
-    existing_tx = db.query(Transaction).filter(
-        Transaction.transaction_id == original_tx_id
-    ).first()
+    clean_tx_id = _clean_tx_id(transaction_id)
     
-    if existing_tx is None and extracted_id:
-        # Try with the extracted ID if the original wasn't found
-        existing_tx = db.query(Transaction).filter(
-            Transaction.transaction_id == extracted_id
-        ).first()
+    # Check if we have already processed this transaction. The session is closed again
+    # before calling the Kaspa API so no pooled connection idles across that request.
+    async with AsyncSessionLocal() as db:
+        existing_tx = (await db.execute(
+            _SEL_TX_BY_ID, {"tx_id": clean_tx_id}
+        )).scalars().first()
     
     # If transaction exists and is verified, return that status
     if existing_tx and existing_tx.verified:
-        print(f"Transaction {clean_tx_id} already verified in database")
+        logger.debug("Transaction %s already verified in database", clean_tx_id)
         return {
             "verified": True,
             "confirmation_time": 0.1,  # Placeholder value since it's already verified
@@ -356,13 +531,13 @@ async def verify_transaction(
     try:
         # Verify the transaction
         result = await kasware_service.verify_transaction_in_blockchain(clean_tx_id)
-        print(f"Verification result: {result}")
+        logger.debug("Verification result: %s", result)
         
-        # If verified, update the database record
-        if result.get("verified", False) and existing_tx and not existing_tx.verified:
-            existing_tx.verified = True
-            db.commit()
-            print(f"Updated transaction {clean_tx_id} to verified in database")
+        # If verified, mark the transaction verified and credit the wallet
+        if result.get("verified", False) and existing_tx:
+            new_balance = await _credit_verified_transaction(clean_tx_id)
+            if new_balance is not None:
+                logger.info("Transaction %s verified; %s now has %s pixels", clean_tx_id, existing_tx.wallet_address, new_balance)
         
         # Add transaction_recorded flag to response
         if existing_tx:
@@ -370,16 +545,19 @@ async def verify_transaction(
         
         return result
     except Exception as e:
-        print(f"Error during transaction verification: {e}")
-        
-        # Return a user-friendly error with transaction_recorded flag 
-        # if we have it in the database
-        return {
-            "verified": False,
-            "error": str(e),
-            "message": "Error verifying transaction. Your transaction has been recorded and will be verified when the API is available.",
-            "transaction_recorded": existing_tx is not None
-        }
+        logger.error("Error during transaction verification: %s", e)
+        
+        # The Kaspa API is unavailable; tell the client to retry, noting whether
+        # the transaction is recorded so it will still be verified later
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={
+                "verified": False,
+                "error": str(e),
+                "message": "Error verifying transaction. Your transaction has been recorded and will be verified when the API is available.",
+                "transaction_recorded": existing_tx is not None
+            }
+        )
 
 @router.get("/transactions/metrics", response_model=TransactionMetrics)
 async def get_transaction_metrics(
@@ -400,329 +578,284 @@ async def get_transaction_metrics(
             "error": "Transaction verification is disabled"
         }
     
-    # Clean up transaction_id if it's a JSON string
-    if transaction_id and transaction_id.startswith('{') and transaction_id.endswith('}'):
-        try:
-            import json
-            tx_data = json.loads(transaction_id)
-            if 'id' in tx_data:
-                transaction_id = tx_data['id']
-                print(f"Extracted transaction ID from JSON for metrics: {transaction_id}")
-        except Exception as e:
-            print(f"Error parsing transaction ID as JSON for metrics: {e}")
-            # Continue with original ID if parsing fails
-    
-    # Strip any quotes or whitespace if transaction_id is provided
     if transaction_id:
-        transaction_id = transaction_id.strip().strip('"\'')
-        print(f"Cleaned transaction ID for metrics: {transaction_id}")
+        transaction_id = _clean_tx_id(transaction_id)
     
     # Get transaction metrics
     metrics = kasware_service.get_transaction_metrics(transaction_id)
-    print(f"Transaction metrics: {metrics}")
+    logger.debug("Transaction metrics: %s", metrics)
     
     return metrics
 
 @router.get("/canvas")
-async def get_canvas():
+async def get_canvas(request: Request, format: Literal["json", "png", "raw"] = "json"):
     """
     Get the current state of the canvas.
+    "png" returns an RGBA image; "raw" returns the packed RGBA bytes row by row.
+    Responses carry an ETag that changes with every pixel, so clients sending
+    If-None-Match get a 304 while the canvas is unchanged.
     """
-    return {"canvas_state": connection_manager.canvas_state}
+    canvas = connection_manager.canvas
+    etag = f'"{canvas.etag}-{format}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    if format == "png":
+        return Response(content=canvas.to_png(), media_type="image/png", headers=headers)
+    if format == "raw":
+        headers.update({"X-Canvas-Width": str(canvas.width), "X-Canvas-Height": str(canvas.height)})
+        return Response(content=canvas.to_bytes(), media_type="application/octet-stream", headers=headers)
+    return Response(
+        content=orjson.dumps({"canvas_state": canvas.to_dict()}),
+        media_type="application/json",
+        headers=headers
+    )
 
 @router.get("/config")
-async def get_config(settings: Settings = Depends(get_settings)):
+async def get_config(request: Request):
     """
     Get public configuration for the frontend.
     """
-    return {
-        "canvas_width": settings.CANVAS_WIDTH,
-        "canvas_height": settings.CANVAS_HEIGHT,
-        "pixel_pack_cost": settings.PIXEL_PACK_COST,
-        "pixel_pack_cost_sompi": settings.PIXEL_PACK_COST_SOMPI,
-        "pixel_pack_size": settings.PIXEL_PACK_SIZE,
-        "receiver_address": settings.RECEIVER_ADDRESS,
-        "verify_transactions": settings.enable_transaction_verification,
-        "transaction_check_interval": settings.TRANSACTION_CHECK_INTERVAL
-    }
+    headers = {"ETag": PUBLIC_CONFIG_ETAG, "Cache-Control": "public, max-age=3600"}
+    if _etag_matches(request, PUBLIC_CONFIG_ETAG):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=PUBLIC_CONFIG_BODY, media_type="application/json", headers=headers)
 
 @router.get("/debug/blocks")
-async def debug_blocks():
+async def debug_blocks(request: Request):
     """
     Debug endpoint to check the structure of blocks from the Kaspa API.
     """
-    try:
-        import httpx
+    client = request.app.state.http
+    
+    # Get the current tip hash
+    tip_response = await client.get(f"https://api.kaspa.org/info/blockdag")
+    if tip_response.status_code != 200:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"Failed to get tip hash: {tip_response.status_code}"
+        )
+    
+    tip_hash = tip_response.json()["tipHashes"][0]
+    
+    # Get blocks
+    blocks_response = await client.get(
+        f"https://api.kaspa.org/blocks",
+        params={"lowHash": tip_hash, "includeBlocks": "true"}
+    )
+    
+    if blocks_response.status_code != 200:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"Failed to get blocks: {blocks_response.status_code}"
+        )
+    
+    blocks_data = blocks_response.json()
+    
+    # Analyze structure
+    result = {
+        "blocks_data_keys": list(blocks_data.keys()),
+        "has_keys": "keys" in blocks_data,
+        "has_blockHashes": "blockHashes" in blocks_data,
+        "blockHashes_count": len(blocks_data.get("blockHashes", [])),
+        "keys_count": len(blocks_data.get("keys", [])),
+        "first_block_sample": None
+    }
+    
+    # Check first block structure if available
+    if "keys" in blocks_data and len(blocks_data["keys"]) > 0:
+        first_block = blocks_data["keys"][0]
+        result["first_block_sample"] = {
+            "keys": list(first_block.keys()),
+            "has_verboseData": "verboseData" in first_block,
+        }
         
-        # Get the current tip hash
-        async with httpx.AsyncClient() as client:
-            tip_response = await client.get(f"https://api.kaspa.org/info/blockdag")
-            if tip_response.status_code != 200:
-                return {"error": f"Failed to get tip hash: {tip_response.status_code}"}
-            
-            tip_hash = tip_response.json()["tipHashes"][0]
-            
-            # Get blocks
-            blocks_response = await client.get(
-                f"https://api.kaspa.org/blocks",
-                params={"lowHash": tip_hash, "includeBlocks": "true"}
-            )
-            
-            if blocks_response.status_code != 200:
-                return {"error": f"Failed to get blocks: {blocks_response.status_code}"}
+        if "verboseData" in first_block:
+            verbose_data = first_block["verboseData"]
+            result["first_block_sample"]["verboseData_keys"] = list(verbose_data.keys())
+            result["first_block_sample"]["has_transactionIds"] = "transactionIds" in verbose_data
             
-            blocks_data = blocks_response.json()
-            
-            # Analyze structure
-            result = {
-                "blocks_data_keys": list(blocks_data.keys()),
-                "has_keys": "keys" in blocks_data,
-                "has_blockHashes": "blockHashes" in blocks_data,
-                "blockHashes_count": len(blocks_data.get("blockHashes", [])),
-                "keys_count": len(blocks_data.get("keys", [])),
-                "first_block_sample": None
-            }
-            
-            # Check first block structure if available
-            if "keys" in blocks_data and len(blocks_data["keys"]) > 0:
-                first_block = blocks_data["keys"][0]
-                result["first_block_sample"] = {
-                    "keys": list(first_block.keys()),
-                    "has_verboseData": "verboseData" in first_block,
-                }
-                
-                if "verboseData" in first_block:
-                    verbose_data = first_block["verboseData"]
-                    result["first_block_sample"]["verboseData_keys"] = list(verbose_data.keys())
-                    result["first_block_sample"]["has_transactionIds"] = "transactionIds" in verbose_data
-                    
-                    if "transactionIds" in verbose_data:
-                        result["first_block_sample"]["transactionIds_count"] = len(verbose_data["transactionIds"])
-                        result["first_block_sample"]["first_few_transactionIds"] = verbose_data["transactionIds"][:3] if verbose_data["transactionIds"] else []
-            
-            return result
-    except Exception as e:
-        return {
-            "error": str(e),
-            "traceback": traceback.format_exc()
-        }
+            if "transactionIds" in verbose_data:
+                result["first_block_sample"]["transactionIds_count"] = len(verbose_data["transactionIds"])
+                result["first_block_sample"]["first_few_transactionIds"] = verbose_data["transactionIds"][:3] if verbose_data["transactionIds"] else []
+    
+    return result
 
 @router.post("/purchases", status_code=status.HTTP_202_ACCEPTED)
 async def purchase_pixels(
     wallet_address: str,
     transaction_id: str,
     amount_sompi: int,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     settings: Settings = Depends(get_settings)
 ):
     """
     Process a pixel purchase transaction.
     """
-    print(f"Purchase request received: wallet={wallet_address}, tx={transaction_id}, amount={amount_sompi}")
-    try:
-        # Check if transaction already exists
-        existing_transaction = db.query(Transaction).filter(
-            Transaction.transaction_id == transaction_id
-        ).first()
-        
-        if existing_transaction:
-            print(f"Transaction {transaction_id} already processed")
+    transaction_id = _clean_tx_id(transaction_id)
+    logger.info("Purchase request received: wallet=%s, tx=%s, amount=%s", wallet_address, transaction_id, amount_sompi)
+    # Check if transaction already exists
+    existing_transaction = (await db.execute(
+        _SEL_TX_BY_ID, {"tx_id": transaction_id}
+    )).scalars().first()
+    
+    if existing_transaction:
+        logger.debug("Transaction %s already processed", transaction_id)
+        
+        # If transaction exists and is verified, return the current balance
+        if existing_transaction.verified:
+            wallet_balance = (await db.execute(
+                _SEL_WALLET, {"addr": wallet_address}
+            )).scalars().first()
             
-            # If transaction exists and is verified, return the current balance
-            if existing_transaction.verified:
-                wallet_balance = db.query(WalletBalance).filter(
-                    WalletBalance.wallet_address == wallet_address
-                ).first()
-                
-                return {
-                    "message": "Transaction already processed",
-                    "pixels_added": existing_transaction.pixels_added,
-                    "new_balance": wallet_balance.pixel_balance if wallet_balance else 0
-                }
-            else:
-                # If transaction exists but is not verified, return pending status
-                # but still start verification in the background
-                background_tasks.add_task(verify_transaction_and_update_balance, transaction_id, None)
-                
-                return {
-                    "message": "Transaction pending verification",
-                    "status": "pending",
-                    "estimated_pixels": existing_transaction.pixels_added
-                }
-        
-        # Calculate pixels to add based on amount
-        # Use the settings values for pixel cost and pack size
-        # Calculate how many packs were purchased
-        pixel_pack_cost = settings.PIXEL_PACK_COST_SOMPI
-        packs_purchased = amount_sompi // pixel_pack_cost
-        pixels_to_add = packs_purchased * settings.PIXEL_PACK_SIZE
-        
-        print(f"Calculated {pixels_to_add} pixels to add for {amount_sompi} sompi (pack cost: {pixel_pack_cost}, pack size: {settings.PIXEL_PACK_SIZE})")
-        
-        if pixels_to_add <= 0:
-            print(f"Amount {amount_sompi} too small for pixel purchase (minimum: {pixel_pack_cost} sompi)")
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Amount too small for pixel purchase. Minimum amount is {pixel_pack_cost} sompi."
-            )
-        
-        # Create transaction record (but don't add pixels yet)
-        transaction = Transaction(
-            transaction_id=transaction_id,
-            wallet_address=wallet_address,
-            amount_sompi=amount_sompi,
-            pixels_added=pixels_to_add,
-            verified=False
+            return {
+                "message": "Transaction already processed",
+                "pixels_added": existing_transaction.pixels_added,
+                "new_balance": wallet_balance.pixel_balance if wallet_balance else 0
+            }
+        else:
+            # If transaction exists but is not verified, return pending status
+            # but still start verification in the background
+            verification_scheduler.spawn(verify_transaction_and_update_balance, transaction_id)
+            
+            return {
+                "message": "Transaction pending verification",
+                "status": "pending",
+                "estimated_pixels": existing_transaction.pixels_added
+            }
+    
+    # Calculate pixels to add based on amount
+    # Use the settings values for pixel cost and pack size
+    # Calculate how many packs were purchased
+    pixel_pack_cost = settings.PIXEL_PACK_COST_SOMPI
+    packs_purchased = amount_sompi // pixel_pack_cost
+    pixels_to_add = packs_purchased * settings.PIXEL_PACK_SIZE
+    
+    logger.debug("Calculated %s pixels to add for %s sompi (pack cost: %s, pack size: %s)", pixels_to_add, amount_sompi, pixel_pack_cost, settings.PIXEL_PACK_SIZE)
+    
+    if pixels_to_add <= 0:
+        logger.warning("Amount %s too small for pixel purchase (minimum: %s sompi)", amount_sompi, pixel_pack_cost)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Amount too small for pixel purchase. Minimum amount is {pixel_pack_cost} sompi."
         )
-        
-        # Save transaction to database
-        db.add(transaction)
-        db.commit()
-        print(f"Transaction saved to database: {transaction_id}")
-        
-        # Start transaction verification in the background
-        if settings.enable_transaction_verification:
-            background_tasks.add_task(verify_transaction_and_update_balance, transaction_id, None)
-            print(f"Started background verification for {transaction_id}")
-        
-        # Get current wallet balance (without adding pixels yet)
-        wallet_balance = db.query(WalletBalance).filter(
-            WalletBalance.wallet_address == wallet_address
-        ).first()
-        
-        current_balance = wallet_balance.pixel_balance if wallet_balance else 0
-        
-        return {
-            "message": "Purchase submitted for verification",
-            "status": "pending",
-            "estimated_pixels": pixels_to_add,
-            "current_balance": current_balance,
-            "new_balance": current_balance  # Frontend will still show the old balance until verification completes
-        }
-    except HTTPException as e:
-        print(f"HTTP Exception in purchase_pixels: {e.detail}")
-        raise e
-    except Exception as e:
-        print(f"Exception in purchase_pixels: {str(e)}")
-        return {"error": str(e)}
+    
+    # Create transaction record (but don't add pixels yet)
+    transaction = Transaction(
+        transaction_id=transaction_id,
+        wallet_address=wallet_address,
+        amount_sompi=amount_sompi,
+        pixels_added=pixels_to_add,
+        verified=False
+    )
+    
+    # Save transaction to database
+    db.add(transaction)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # A concurrent request recorded the same transaction first
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Transaction already submitted"
+        )
+    logger.info("Transaction saved to database: %s", transaction_id)
+    
+    # Start transaction verification in the background
+    if settings.enable_transaction_verification:
+        verification_scheduler.spawn(verify_transaction_and_update_balance, transaction_id)
+        logger.info("Started background verification for %s", transaction_id)
+    
+    # Get current wallet balance (without adding pixels yet)
+    wallet_balance = (await db.execute(
+        _SEL_WALLET, {"addr": wallet_address}
+    )).scalars().first()
+    
+    current_balance = wallet_balance.pixel_balance if wallet_balance else 0
+    
+    return {
+        "message": "Purchase submitted for verification",
+        "status": "pending",
+        "estimated_pixels": pixels_to_add,
+        "current_balance": current_balance,
+        "new_balance": current_balance  # Frontend will still show the old balance until verification completes
+    }
 
 @router.get("/wallets/{wallet_address}/balance")
 async def get_wallet_balance(
     wallet_address: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get the pixel balance for a wallet.
-    This endpoint will also perform a quick verification to ensure
-    the wallet balance matches the verified transactions.
+    This is a single read of the stored balance; wallets without a balance
+    record have 0 pixels. Use the sync endpoint to reconcile a balance with
+    the wallet's verified transactions.
     """
-    print(f"Received balance request for wallet: '{wallet_address}'")
-    
-    # Check for any verified transactions that might need to be reflected in the balance
-    verified_transactions = db.query(Transaction).filter(
-        Transaction.wallet_address == wallet_address,
-        Transaction.verified == True
-    ).all()
+    logger.debug("Received balance request for wallet: '%s'", wallet_address)
     
-    # Calculate total pixels from verified transactions
-    total_pixels = sum(tx.pixels_added for tx in verified_transactions) if verified_transactions else 0
-    print(f"Found {len(verified_transactions)} verified transactions with a total of {total_pixels} pixels")
+    # Single case-insensitive index lookup
+    pixel_balance = (await db.execute(
+        _SEL_WALLET_BALANCE_CI, {"addr": wallet_address.lower()}
+    )).scalars().first()
     
-    # Try to find the exact match first
-    wallet_balance = db.query(WalletBalance).filter(
-        WalletBalance.wallet_address == wallet_address
-    ).first()
+    if pixel_balance is None:
+        logger.debug("No wallet balance found for '%s'", wallet_address)
+        return {"pixel_balance": 0}
     
-    if not wallet_balance:
-        print(f"No exact wallet balance match found for '{wallet_address}'")
-        
-        # Try a case-insensitive search as a fallback
-        wallet_balance = db.query(WalletBalance).filter(
-            func.lower(WalletBalance.wallet_address) == func.lower(wallet_address)
-        ).first()
-        
-        if wallet_balance:
-            print(f"Found wallet balance with case-insensitive match: '{wallet_balance.wallet_address}' with {wallet_balance.pixel_balance} pixels")
-        else:
-            print(f"No wallet balance found for '{wallet_address}' - creating a new record")
-            
-            # Create a new wallet balance record
-            wallet_balance = WalletBalance(
-                wallet_address=wallet_address,
-                pixel_balance=total_pixels
-            )
-            
-            # Save to database
-            db.add(wallet_balance)
-            db.commit()
-            
-            print(f"Created new wallet balance for '{wallet_address}' with {total_pixels} pixels from {len(verified_transactions)} verified transactions")
-            
-            return {"pixel_balance": total_pixels}
-    
-    # Check if the wallet balance needs to be synced with verified transactions
-    if wallet_balance.pixel_balance != total_pixels:
-        print(f"Wallet balance ({wallet_balance.pixel_balance}) does not match verified transactions total ({total_pixels}) - updating")
-        old_balance = wallet_balance.pixel_balance
-        wallet_balance.pixel_balance = total_pixels
-        db.commit()
-        print(f"Updated wallet balance from {old_balance} to {total_pixels}")
-    
-    print(f"Found wallet balance for '{wallet_address}': {wallet_balance.pixel_balance}")
-    return {"pixel_balance": wallet_balance.pixel_balance}
+    logger.debug("Found wallet balance for '%s': %s", wallet_address, pixel_balance)
+    return {"pixel_balance": pixel_balance}
 
 @router.post("/wallets/{wallet_address}/sync")
 async def sync_wallet_balance(
     wallet_address: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Sync a wallet's balance with its verified transactions.
-    This is useful for cases where the background verification task
-    might have failed to update the wallet balance.
+    The balance is rebuilt as the pixels purchased in verified transactions minus
+    the pixels already placed, so credits the background verification task missed
+    are restored without refunding spent pixels.
     """
-    print(f"Syncing wallet balance for: '{wallet_address}'")
+    logger.info("Syncing wallet balance for: '%s'", wallet_address)
     
     # Get all verified transactions for this wallet
-    verified_transactions = db.query(Transaction).filter(
-        Transaction.wallet_address == wallet_address,
-        Transaction.verified == True
-    ).all()
-    
-    # Calculate total pixels from verified transactions
-    total_pixels = sum(tx.pixels_added for tx in verified_transactions) if verified_transactions else 0
-    print(f"Found {len(verified_transactions)} verified transactions with a total of {total_pixels} pixels")
+    total_pixels, tx_count = (await db.execute(
+        _SUM_VERIFIED_TXS, {"addr": wallet_address.lower()}
+    )).one()
+    logger.debug("Found %s verified transactions with a total of %s pixels", tx_count, total_pixels)
     
-    # Get or create the wallet balance record
-    wallet_balance = db.query(WalletBalance).filter(
-        WalletBalance.wallet_address == wallet_address
-    ).first()
+    # Get or create the wallet balance record. The row stays locked until the commit so a
+    # concurrent spend can't land between reading pixels_spent and writing the balance.
+    wallet_balance = (await db.execute(
+        _SEL_WALLET_CI_FOR_UPDATE, {"addr": wallet_address.lower()}
+    )).scalars().first()
     
     if not wallet_balance:
-        print(f"Creating new wallet balance for '{wallet_address}'")
-        wallet_balance = WalletBalance(
-            wallet_address=wallet_address,
-            pixel_balance=total_pixels
-        )
-        db.add(wallet_balance)
-        db.commit()
+        logger.debug("Creating new wallet balance for '%s'", wallet_address)
+        pixel_balance = (await db.execute(
+            _UPSERT_WALLET_SET, {"addr": wallet_address, "pixels": total_pixels}
+        )).scalar_one()
+        await db.commit()
         return {
-            "message": f"Created new wallet balance with {total_pixels} pixels from {len(verified_transactions)} verified transactions",
-            "pixel_balance": total_pixels,
-            "verified_transactions": len(verified_transactions)
+            "message": f"Created new wallet balance with {pixel_balance} pixels from {tx_count} verified transactions",
+            "pixel_balance": pixel_balance,
+            "verified_transactions": tx_count
         }
     
-    # Update the wallet balance
+    # Update the wallet balance to what was purchased and not yet spent
     old_balance = wallet_balance.pixel_balance
-    wallet_balance.pixel_balance = total_pixels
-    db.commit()
+    new_balance = max(total_pixels - wallet_balance.pixels_spent, 0)
+    wallet_balance.pixel_balance = new_balance
+    await db.commit()
     
-    print(f"Updated wallet balance from {old_balance} to {total_pixels} pixels")
+    logger.info("Updated wallet balance from %s to %s pixels", old_balance, new_balance)
     
     return {
-        "message": f"Wallet balance synced from {old_balance} to {total_pixels} pixels",
-        "pixel_balance": total_pixels,
-        "verified_transactions": len(verified_transactions),
-        "balance_difference": total_pixels - old_balance
+        "message": f"Wallet balance synced from {old_balance} to {new_balance} pixels",
+        "pixel_balance": new_balance,
+        "verified_transactions": tx_count,
+        "balance_difference": new_balance - old_balance
     } 
\ No newline at end of file
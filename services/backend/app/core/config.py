@@ -1,3 +1,4 @@
+from functools import cached_property, lru_cache
 from typing import List
 import os
 from pydantic_settings import BaseSettings
@@ -21,31 +22,66 @@ class Settings(BaseSettings):
         "*",                      # Allow all origins (for development only)
     ]
     
+    # Logging Settings
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO").upper()
+    
     # Database Settings
     DATABASE_URL: str = os.getenv("DATABASE_URL", "postgresql://postgres:postgres@db:5432/kaspixel")
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "20"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_TIMEOUT: int = int(os.getenv("DB_POOL_TIMEOUT", "30"))  # seconds
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "3600"))  # seconds
+    # Set when running behind PgBouncer in transaction mode so the bouncer does the pooling
+    DB_USE_NULL_POOL: bool = os.getenv("DB_USE_NULL_POOL", "False").lower() == "true"
     
     # Canvas Settings
     CANVAS_WIDTH: int = int(os.getenv("CANVAS_WIDTH", "1000"))
     CANVAS_HEIGHT: int = int(os.getenv("CANVAS_HEIGHT", "1000"))
     # Convert KAS to sompi (1 KAS = 100,000,000 sompi)
     PIXEL_PACK_COST: float = float(os.getenv("PIXEL_PACK_COST", "0.2"))  # 0.2 KAS per pack
-    PIXEL_PACK_COST_SOMPI: int = int(PIXEL_PACK_COST * 100000000)  # Convert to sompi
     PIXEL_PACK_SIZE: int = int(os.getenv("PIXEL_PACK_SIZE", "10"))  # Number of pixels per pack
+    MAX_PIXEL_BATCH: int = int(os.getenv("MAX_PIXEL_BATCH", "500"))  # Most pixels accepted by POST /pixels/batch
+    
+    # WebSocket Settings
+    WS_BATCH_WINDOW_MS: int = int(os.getenv("WS_BATCH_WINDOW_MS", "10"))  # milliseconds to coalesce updates
+    WS_BATCH_MAX_PIXELS: int = int(os.getenv("WS_BATCH_MAX_PIXELS", "4096"))  # pending pixels that flush a batch early
+    WS_SEND_QUEUE_SIZE: int = int(os.getenv("WS_SEND_QUEUE_SIZE", "1000"))  # pending messages before a client is dropped
     
     # Kaspa Network Settings
     # Using the consolidated environment variable that's shared with frontend
     KASPA_API_URL: str = os.getenv("NEXT_PUBLIC_KASPA_URL", "https://api.kaspa.org")
     
+    # Internal Settings
+    # Shared secret for /internal endpoints (e.g. the wipe_pixels canvas reload); empty disables them
+    INTERNAL_API_TOKEN: str = os.getenv("INTERNAL_API_TOKEN", "")
+    
     # Payment Settings
     RECEIVER_ADDRESS: str = os.getenv("RECEIVER_ADDRESS", "")  # Default empty, must be set in .env
     
     # Transaction Verification Settings
     enable_transaction_verification: bool = os.getenv("VERIFY_TRANSACTIONS", "True").lower() == "true"
     TRANSACTION_CHECK_INTERVAL: int = int(os.getenv("TRANSACTION_CHECK_INTERVAL", "500"))  # milliseconds
+    KASPA_DEBUG: bool = os.getenv("KASPA_DEBUG", "False").lower() == "true"  # per-poll Kaspa API diagnostics
+    VERIFY_CONCURRENCY: int = int(os.getenv("VERIFY_CONCURRENCY", "32"))  # verifications running at once
+    VERIFY_PENDING_LIMIT: int = int(os.getenv("VERIFY_PENDING_LIMIT", "1000"))  # queued before the oldest is dropped
+    VERIFY_MAX_RETRIES: int = int(os.getenv("VERIFY_MAX_RETRIES", "2"))  # retries for a verification that raises
+    
+    @cached_property
+    def PIXEL_PACK_COST_SOMPI(self) -> int:
+        # Derived once from the loaded PIXEL_PACK_COST; rounded so 0.29 KAS isn't 28999999 sompi
+        return round(self.PIXEL_PACK_COST * 100000000)
     
     class Config:
         case_sensitive = True
         env_file = ".env"
 
-# Create a global settings instance
-settings = Settings() 
\ No newline at end of file
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """
+    The application settings, built once on first use.
+    Also usable as a FastAPI dependency.
+    """
+    return Settings()
+
+# Shared instance for module-level use; the same object get_settings() returns
+settings = get_settings() 
\ No newline at end of file
@@ -1,17 +1,64 @@
+import logging
+
+from sqlalchemy import text
 from sqlalchemy.orm import Session
 
 from app.db.base_class import Base
 from app.db.session import engine
 from app.db.migrations.add_wallet_balance_tables import upgrade as add_wallet_balance_tables
+from app.db.migrations.add_wallet_address_lower_index import upgrade as add_wallet_address_lower_index
+from app.db.migrations.add_lookup_indexes import upgrade as add_lookup_indexes
+from app.db.migrations.add_unique_pixel_coordinates import upgrade as add_unique_pixel_coordinates
+from app.db.migrations.add_wallet_pixels_spent import upgrade as add_wallet_pixels_spent
+
+logger = logging.getLogger(__name__)
+
+# Migrations run in order on a database that isn't at SCHEMA_VERSION yet; each one is idempotent
+MIGRATIONS = [
+    ("wallet balance tables", add_wallet_balance_tables),
+    ("wallet address lower index", add_wallet_address_lower_index),
+    ("lookup indexes", add_lookup_indexes),
+    ("unique pixel coordinates", add_unique_pixel_coordinates),
+    ("wallet pixels spent", add_wallet_pixels_spent),
+]
+
+# Bump whenever a migration is added so existing databases run the new one on next boot
+SCHEMA_VERSION = "2026_wallet_pixels_spent"
 
 # Create all tables
 def init_db():
+    # A database already at the current version needs no DDL at all
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version TEXT PRIMARY KEY, applied_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+        ))
+        if conn.execute(
+            text("SELECT 1 FROM schema_migrations WHERE version = :version"),
+            {"version": SCHEMA_VERSION}
+        ).first():
+            logger.info("Database schema is at version %s", SCHEMA_VERSION)
+            return
+
     Base.metadata.create_all(bind=engine)
-    
+
     # Run migrations directly
-    try:
-        add_wallet_balance_tables()
-        print("Successfully applied wallet balance tables migration")
-    except Exception as e:
-        print(f"Error applying wallet balance tables migration: {e}")
-        # Continue even if migration fails, as tables might already exist 
\ No newline at end of file
+    failed = False
+    for name, upgrade in MIGRATIONS:
+        try:
+            upgrade()
+            logger.info("Successfully applied %s migration", name)
+        except Exception as e:
+            # Continue even if a migration fails, as its changes might already exist
+            logger.error("Error applying %s migration: %s", name, e)
+            failed = True
+
+    # Only record the version once everything applied, so failures are retried next boot
+    if failed:
+        return
+    with engine.begin() as conn:
+        conn.execute(
+            text("INSERT INTO schema_migrations (version) VALUES (:version) ON CONFLICT DO NOTHING"),
+            {"version": SCHEMA_VERSION}
+        )
+    logger.info("Database schema upgraded to version %s", SCHEMA_VERSION)
@@ -0,0 +1,50 @@
+from sqlalchemy import text
+from app.db.session import engine
+
+# (index name, table, column) for the unique columns every request looks rows up by
+UNIQUE_INDEXES = [
+    ("ix_transactions_transaction_id", "transactions", "transaction_id"),
+    ("ix_wallet_balances_wallet_address", "wallet_balances", "wallet_address"),
+]
+
+# Finds a single-column unique index (including one backing a UNIQUE constraint) on a column
+HAS_UNIQUE_INDEX = text("""
+    SELECT 1
+    FROM pg_index i
+    JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+    WHERE i.indrelid = to_regclass(:table)
+      AND i.indisunique
+      AND i.indnatts = 1
+      AND a.attname = :column
+""")
+
+def upgrade():
+    with engine.connect() as conn:
+        # Tables created before the UNIQUE constraints were added have no index on these columns
+        for name, table, column in UNIQUE_INDEXES:
+            if conn.execute(HAS_UNIQUE_INDEX, {"table": table, "column": column}).first():
+                continue
+            conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS {name} ON {table} ({column})"))
+            print(f"Created {name} index")
+        
+        # Balance checks sum a wallet's verified transactions, matching the address
+        # case-insensitively like the wallet lookup
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_transactions_wallet_address_lower_verified "
+            "ON transactions (lower(wallet_address), verified)"
+        ))
+        # Superseded by the functional index above
+        conn.execute(text("DROP INDEX IF EXISTS ix_transactions_wallet_address"))
+        conn.execute(text("DROP INDEX IF EXISTS ix_transactions_wallet_address_verified"))
+        conn.commit()
+    print("Ensured lookup indexes on transactions and wallet_balances")
+
+def downgrade():
+    # Connect to the database
+    with engine.connect() as conn:
+        # Drop the indexes (constraint-backed indexes are left alone)
+        for name, _, _ in UNIQUE_INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        conn.execute(text("DROP INDEX IF EXISTS ix_transactions_wallet_address_lower_verified"))
+        conn.commit()
+    print("Dropped lookup indexes on transactions and wallet_balances")
@@ -0,0 +1,34 @@
+from sqlalchemy import text
+from app.db.session import engine
+
+def upgrade():
+    with engine.connect() as conn:
+        exists = conn.execute(text(
+            "SELECT 1 FROM pg_constraint WHERE conname = 'uq_pixels_xy'"
+        )).first()
+        if not exists:
+            # Keep only the latest pixel placed in each cell
+            result = conn.execute(text("""
+                DELETE FROM pixels
+                WHERE id NOT IN (SELECT max(id) FROM pixels GROUP BY x, y)
+            """))
+            print(f"Removed {result.rowcount} superseded pixels")
+        conn.commit()
+    
+    if not exists:
+        # Build the index without locking out pixel writes, then attach it as the constraint;
+        # CONCURRENTLY can't run inside a transaction block
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            # A previously interrupted concurrent build leaves an invalid index behind
+            conn.execute(text("DROP INDEX CONCURRENTLY IF EXISTS uq_pixels_xy"))
+            conn.execute(text("CREATE UNIQUE INDEX CONCURRENTLY uq_pixels_xy ON pixels (x, y)"))
+            conn.execute(text("ALTER TABLE pixels ADD CONSTRAINT uq_pixels_xy UNIQUE USING INDEX uq_pixels_xy"))
+    print("Ensured unique (x, y) constraint on pixels")
+
+def downgrade():
+    # Connect to the database
+    with engine.connect() as conn:
+        # Drop the constraint; removed pixel history is not restored
+        conn.execute(text("ALTER TABLE pixels DROP CONSTRAINT IF EXISTS uq_pixels_xy"))
+        conn.commit()
+    print("Dropped unique (x, y) constraint on pixels")
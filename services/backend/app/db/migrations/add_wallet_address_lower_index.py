@@ -0,0 +1,20 @@
+from sqlalchemy import text
+from app.db.session import engine
+
+def upgrade():
+    # Create a functional index so case-insensitive wallet lookups don't scan the table
+    with engine.connect() as conn:
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_wallet_balances_wallet_address_lower "
+            "ON wallet_balances (lower(wallet_address))"
+        ))
+        conn.commit()
+    print("Created ix_wallet_balances_wallet_address_lower index")
+
+def downgrade():
+    # Connect to the database
+    with engine.connect() as conn:
+        # Drop the index
+        conn.execute(text("DROP INDEX IF EXISTS ix_wallet_balances_wallet_address_lower"))
+        conn.commit()
+    print("Dropped ix_wallet_balances_wallet_address_lower index")
@@ -3,34 +3,40 @@ from app.db.session import engine
 
 metadata = MetaData()
 
+# wallet_balances table
+wallet_balances = Table(
+    'wallet_balances',
+    metadata,
+    Column('id', Integer, primary_key=True, index=True),
+    Column('wallet_address', String, nullable=False),
+    Column('pixel_balance', Integer, nullable=False, default=0),
+    Column('last_updated', DateTime(timezone=True), server_default=func.now()),
+    UniqueConstraint('wallet_address')
+)
+
+# transactions table
+transactions = Table(
+    'transactions',
+    metadata,
+    Column('id', Integer, primary_key=True, index=True),
+    Column('transaction_id', String, nullable=False),
+    Column('wallet_address', String, nullable=False),
+    Column('amount_sompi', Integer, nullable=False),
+    Column('pixels_added', Integer, nullable=False),
+    Column('verified', Boolean, default=False),
+    Column('created_at', DateTime(timezone=True), server_default=func.now()),
+    UniqueConstraint('transaction_id')
+)
+
 def upgrade():
-    # Create wallet_balances table
-    wallet_balances = Table(
-        'wallet_balances',
-        metadata,
-        Column('id', Integer, primary_key=True, index=True),
-        Column('wallet_address', String, nullable=False),
-        Column('pixel_balance', Integer, nullable=False, default=0),
-        Column('last_updated', DateTime(timezone=True), server_default=func.now()),
-        UniqueConstraint('wallet_address')
-    )
-    
-    # Create transactions table
-    transactions = Table(
-        'transactions',
-        metadata,
-        Column('id', Integer, primary_key=True, index=True),
-        Column('transaction_id', String, nullable=False),
-        Column('wallet_address', String, nullable=False),
-        Column('amount_sompi', Integer, nullable=False),
-        Column('pixels_added', Integer, nullable=False),
-        Column('verified', Boolean, default=False),
-        Column('created_at', DateTime(timezone=True), server_default=func.now()),
-        UniqueConstraint('transaction_id')
-    )
-    
-    # Create the tables
-    metadata.create_all(engine)
+    # Create the tables in one transaction, after a single existence check for both
+    with engine.begin() as conn:
+        if None not in conn.execute(
+            text("SELECT to_regclass('wallet_balances'), to_regclass('transactions')")
+        ).one():
+            print("wallet_balances and transactions tables already exist")
+            return
+        metadata.create_all(conn)
     print("Created wallet_balances and transactions tables")
 
 def downgrade():
@@ -40,4 +46,4 @@ def downgrade():
         conn.execute(text("DROP TABLE IF EXISTS transactions"))
         conn.execute(text("DROP TABLE IF EXISTS wallet_balances"))
         conn.commit()
-    print("Dropped wallet_balances and transactions tables") 
\ No newline at end of file
+    print("Dropped wallet_balances and transactions tables")
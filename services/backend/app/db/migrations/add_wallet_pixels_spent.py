@@ -0,0 +1,35 @@
+from sqlalchemy import text
+from app.db.session import engine
+
+def upgrade():
+    with engine.connect() as conn:
+        exists = conn.execute(text(
+            "SELECT 1 FROM information_schema.columns "
+            "WHERE table_name = 'wallet_balances' AND column_name = 'pixels_spent'"
+        )).first()
+        if not exists:
+            conn.execute(text(
+                "ALTER TABLE wallet_balances ADD COLUMN pixels_spent INTEGER NOT NULL DEFAULT 0"
+            ))
+            # Pixels spent before the column existed: whatever was purchased but isn't left
+            conn.execute(text("""
+                UPDATE wallet_balances w
+                SET pixels_spent = GREATEST(t.purchased - w.pixel_balance, 0)
+                FROM (
+                    SELECT lower(wallet_address) AS addr, sum(pixels_added) AS purchased
+                    FROM transactions
+                    WHERE verified
+                    GROUP BY lower(wallet_address)
+                ) t
+                WHERE lower(w.wallet_address) = t.addr
+            """))
+        conn.commit()
+    print("Ensured pixels_spent column on wallet_balances")
+
+def downgrade():
+    # Connect to the database
+    with engine.connect() as conn:
+        # Drop the column
+        conn.execute(text("ALTER TABLE wallet_balances DROP COLUMN IF EXISTS pixels_spent"))
+        conn.commit()
+    print("Dropped pixels_spent column from wallet_balances")
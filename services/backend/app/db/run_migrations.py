@@ -1,3 +1,4 @@
+import importlib
 import sqlite3
 import os
 from pathlib import Path
@@ -35,31 +36,31 @@ def run_migrations():
     migration_files = sorted([f for f in migrations_dir.glob("*.py") if f.name != "__init__.py"])
     
     # Apply each migration that hasn't been applied yet
-    for migration_file in migration_files:
-        migration_name = migration_file.stem
-        
-        if migration_name in applied_migrations:
-            print(f"Migration {migration_name} already applied, skipping...")
-            continue
-        
-        print(f"Applying migration {migration_name}...")
-        
-        # Import the migration module
-        import importlib.util
-        spec = importlib.util.spec_from_file_location(migration_name, migration_file)
-        migration_module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(migration_module)
-        
-        # Run the upgrade function
-        migration_module.upgrade()
-        
-        # Mark the migration as applied
-        cursor.execute("INSERT INTO migrations (name) VALUES (?)", (migration_name,))
-        conn.commit()
-        
-        print(f"Migration {migration_name} applied successfully.")
-    
-    conn.close()
+    newly_applied = []
+    try:
+        for migration_file in migration_files:
+            migration_name = migration_file.stem
+            
+            if migration_name in applied_migrations:
+                print(f"Migration {migration_name} already applied, skipping...")
+                continue
+            
+            print(f"Applying migration {migration_name}...")
+            
+            # Import through the regular import system so cached bytecode is reused
+            migration_module = importlib.import_module(f"app.db.migrations.{migration_name}")
+            
+            # Run the upgrade function
+            migration_module.upgrade()
+            newly_applied.append((migration_name,))
+            
+            print(f"Migration {migration_name} applied successfully.")
+    finally:
+        # Mark everything that ran as applied in one write, even if a later migration failed
+        if newly_applied:
+            cursor.executemany("INSERT INTO migrations (name) VALUES (?)", newly_applied)
+            conn.commit()
+        conn.close()
     print("All migrations applied successfully.")
 
 if __name__ == "__main__":
@@ -1,43 +1,89 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+import asyncio
+import hmac
+import logging
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
+from sqlalchemy import select
 
 from app.core.config import settings
+from app.core.logging_config import setup_logging
+
+# Configure logging before anything else logs; the modules below log while they are imported
+setup_logging()
+
 from app.api.routes import router as api_router
 from app.websockets import manager  # Import the shared manager instance
+from app.websockets.canvas import Canvas
 from app.db.init_db import init_db
 from app.db.session import SessionLocal
 from app.models.pixel import Pixel
+from app.services.kasware import kasware_service
+from app.services.scheduler import verification_scheduler
+
+logger = logging.getLogger(__name__)
+
+# Rows fetched per round trip when loading the canvas at startup
+CANVAS_LOAD_CHUNK_SIZE = 10000
 
 # Function to load pixels from database into canvas state
-def load_canvas_state():
+def load_canvas_state() -> Canvas:
     """
-    Load all pixels from the database into the canvas state.
-    This ensures the canvas state is always in sync with the database.
+    Load all pixels from the database into a new canvas.
+    Runs in a worker thread so the server can start accepting requests meanwhile.
+    """
+    canvas = Canvas(settings.CANVAS_WIDTH, settings.CANVAS_HEIGHT)
+    with SessionLocal() as db:
+        # Stream plain (x, y, color) tuples in chunks; (x, y) is unique so order doesn't matter
+        result = db.execute(
+            select(Pixel.x, Pixel.y, Pixel.color).execution_options(yield_per=CANVAS_LOAD_CHUNK_SIZE)
+        )
+        loaded = skipped = 0
+        for rows in result.partitions():
+            count = canvas.set_many(rows)
+            loaded += count
+            skipped += len(rows) - count
+    
+    if skipped:
+        logger.warning("Skipped %s pixels with invalid coordinates or colors", skipped)
+    logger.info("Canvas state loaded with %s pixels", loaded)
+    return canvas
+
+async def warm_canvas_state():
+    """
+    Load the canvas off the event loop, then swap it in and push it to clients
+    that connected while it was still loading.
     """
-    db = SessionLocal()
     try:
-        pixels = db.query(Pixel).all()
-        print(f"Loading {len(pixels)} pixels from database into canvas state")
-        
-        # Clear existing canvas state
-        manager.canvas_state = {}
-        
-        # Load pixels into canvas state
-        for pixel in pixels:
-            coord_key = f"{pixel.x},{pixel.y}"
-            manager.canvas_state[coord_key] = pixel.color
-            
-        print(f"Canvas state loaded with {len(manager.canvas_state)} pixels")
+        canvas = await run_in_threadpool(load_canvas_state)
     except Exception as e:
-        print(f"Error loading canvas state: {e}")
-    finally:
-        db.close()
+        logger.exception("Error loading canvas state: %s", e)
+        return
+    manager.canvas.adopt(canvas)
+    await manager.broadcast_canvas_update()
+
+async def reload_canvas_state() -> int:
+    """
+    Replace the canvas with what the database holds now (e.g. after a wipe) and
+    push it to every client, without restarting the server.
+    """
+    # Pixels placed while the snapshot loads may be missing from it; keep those
+    manager.canvas.track_changes()
+    try:
+        canvas = await run_in_threadpool(load_canvas_state)
+    except Exception:
+        manager.canvas.stop_tracking()
+        raise
+    manager.canvas.replace(canvas)
+    await manager.broadcast_canvas_update()
+    return len(manager.canvas)
 
 app = FastAPI(
     title="Kaspa Pixel Canvas API",
     description="API for the Kaspa Pixel Canvas Game",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
 )
 
 # CORS middleware configuration
@@ -52,8 +98,30 @@ app.add_middleware(
 # Initialize database
 init_db()
 
-# Load canvas state from database
-load_canvas_state()
+@app.on_event("startup")
+async def startup_http_client():
+    # Share one pooled HTTP client for all outbound Kaspa API calls
+    app.state.http = kasware_service.client
+
+@app.on_event("startup")
+async def startup_canvas_state():
+    # Load canvas state from database in the background; until it lands clients see
+    # what has been placed since startup and get the full state pushed afterwards
+    app.state.canvas_load = asyncio.create_task(warm_canvas_state())
+
+@app.on_event("shutdown")
+async def shutdown_http_client():
+    await verification_scheduler.close()
+    await kasware_service.close()
+
+@app.exception_handler(Exception)
+async def unhandled_exception_handler(request: Request, exc: Exception):
+    """
+    Turn unexpected errors into a plain 500 response instead of leaking details.
+    The server still logs the traceback.
+    """
+    logger.exception("Unhandled error on %s %s", request.method, request.url.path)
+    return JSONResponse(status_code=500, content={"detail": "Internal server error"})
 
 # Include API routes
 app.include_router(api_router, prefix=settings.API_V1_STR)
@@ -68,29 +136,42 @@ async def root():
         }
     )
 
+@app.post("/internal/canvas/reload")
+async def reload_canvas(request: Request):
+    # Only for the wipe_pixels utility: it must send the shared INTERNAL_API_TOKEN from
+    # inside the container, and the endpoint is off when no token is configured
+    token = request.headers.get("X-Internal-Token", "")
+    if (
+        not settings.INTERNAL_API_TOKEN
+        or not hmac.compare_digest(token.encode(), settings.INTERNAL_API_TOKEN.encode())
+        or getattr(request.client, 'host', None) not in ("127.0.0.1", "::1")
+    ):
+        return JSONResponse(status_code=403, content={"detail": "Forbidden"})
+    return {"pixels": await reload_canvas_state()}
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     client_host = getattr(websocket.client, 'host', 'unknown')
     client_id = str(id(websocket))  # Convert to string for better stability
-    print(f"New WebSocket connection request from {client_host} (client_id: {client_id})")
+    logger.debug("New WebSocket connection request from %s (client_id: %s)", client_host, client_id)
     try:
         await manager.connect(websocket)
-        print(f"Starting WebSocket connection handler for {client_host} (client_id: {client_id})")
+        logger.debug("Starting WebSocket connection handler for %s (client_id: %s)", client_host, client_id)
         await manager.handle_connection(websocket)
     except WebSocketDisconnect:
-        print(f"WebSocket disconnected: {client_host} (client_id: {client_id})")
+        logger.debug("WebSocket disconnected: %s (client_id: %s)", client_host, client_id)
         await manager.disconnect(websocket)
     except Exception as e:
-        print(f"Error handling WebSocket connection: {e} (client_id: {client_id})")
+        logger.error("Error handling WebSocket connection: %s (client_id: %s)", e, client_id)
         try:
             await manager.disconnect(websocket)
         except Exception as disconnect_error:
-            print(f"Error during disconnect: {disconnect_error} (client_id: {client_id})")
+            logger.error("Error during disconnect: %s (client_id: %s)", disconnect_error, client_id)
     finally:
         # Ensure the connection is properly cleaned up
         try:
-            if client_id in manager.active_connections:
-                print(f"Cleaning up connection in finally block: {client_id}")
+            if websocket in manager.active_connections:
+                logger.debug("Cleaning up connection in finally block: %s", client_id)
                 await manager.disconnect(websocket)
         except Exception as e:
-            print(f"Error cleaning up connection: {e} (client_id: {client_id})") 
\ No newline at end of file
+            logger.error("Error cleaning up connection: %s (client_id: %s)", e, client_id)
\ No newline at end of file
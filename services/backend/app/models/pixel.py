@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, UniqueConstraint
 from sqlalchemy.sql import func
 from app.db.base_class import Base
 
@@ -13,5 +13,8 @@ class Pixel(Base):
     transaction_id = Column(String, nullable=False, unique=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
+    # One row per cell; placing a pixel overwrites the cell's previous one
+    __table_args__ = (UniqueConstraint(x, y, name="uq_pixels_xy"),)
+    
     class Config:
         orm_mode = True 
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Index
 from sqlalchemy.sql import func
 from app.db.base_class import Base
 
@@ -13,5 +13,10 @@ class Transaction(Base):
     verified = Column(Boolean, default=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
+    __table_args__ = (
+        # Balance syncs sum a wallet's verified transactions, matching the address case-insensitively
+        Index("ix_transactions_wallet_address_lower_verified", func.lower(wallet_address), verified),
+    )
+    
     class Config:
         orm_mode = True 
\ No newline at end of file
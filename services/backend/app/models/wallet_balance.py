@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, Index
 from sqlalchemy.sql import func
 from app.db.base_class import Base
 
@@ -8,7 +8,14 @@ class WalletBalance(Base):
     id = Column(Integer, primary_key=True, index=True)
     wallet_address = Column(String, nullable=False, unique=True)
     pixel_balance = Column(Integer, default=0, nullable=False)
+    # Running total of pixels placed, so a sync can rebuild the balance as purchased minus spent
+    pixels_spent = Column(Integer, default=0, server_default="0", nullable=False)
     last_updated = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
+    __table_args__ = (
+        # Functional index for case-insensitive wallet lookups
+        Index("ix_wallet_balances_wallet_address_lower", func.lower(wallet_address)),
+    )
+    
     class Config:
         orm_mode = True 
\ No newline at end of file
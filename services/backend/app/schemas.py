@@ -1,6 +1,11 @@
 from typing import Dict, List, Optional, Any, Union
 from pydantic import BaseModel, Field
 
+from app.core.config import settings
+
+# "#rgb", "#rrggbb" or "#rrggbbaa"
+COLOR_PATTERN = r"^#(?:[0-9a-fA-F]{3}|[0-9a-fA-F]{6}|[0-9a-fA-F]{8})$"
+
 class TransactionVerification(BaseModel):
     """
     Schema for transaction verification response.
@@ -34,6 +39,22 @@ class PixelPlacement(BaseModel):
     address: str
     transaction_id: str
 
+class BatchPixel(BaseModel):
+    """
+    Schema for a single pixel within a batch placement.
+    """
+    x: int = Field(ge=0, lt=settings.CANVAS_WIDTH)
+    y: int = Field(ge=0, lt=settings.CANVAS_HEIGHT)
+    color: str = Field(pattern=COLOR_PATTERN)
+    transaction_id: str
+
+class PixelBatchPlacement(BaseModel):
+    """
+    Schema for placing several pixels in one request.
+    """
+    wallet_address: str
+    pixels: List[BatchPixel] = Field(min_length=1, max_length=settings.MAX_PIXEL_BATCH)
+
 class PixelUpdate(BaseModel):
     """
     Schema for pixel update via WebSocket.
@@ -1,9 +1,36 @@
-from typing import Optional, Dict, Any
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple
 import httpx
+import orjson
 import time
 import asyncio
+import logging
+import random
+import re
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+# Per-poll diagnostics are logged at DEBUG; KASPA_DEBUG turns them on for this module only
+if settings.KASPA_DEBUG:
+    logger.setLevel(logging.DEBUG)
+
+# A well-formed Kaspa transaction ID; these skip the cleanup below
+TX_ID_PATTERN = re.compile(r"[0-9a-fA-F]{64}")
+
+# Most transactions kept in transaction_times; the oldest are forgotten first
+TRANSACTION_TIMES_MAX = 10000
+
+# Seconds the block scanner keeps looking for a transaction after the last request about it
+SCAN_WATCH_TIMEOUT = 600
+
+# Full-jitter exponential backoff for failing API hosts: after n consecutive failures a host
+# is skipped for a random 0..min(HOST_BACKOFF_CAP, HOST_BACKOFF_BASE * 2**n) seconds
+HOST_BACKOFF_BASE = 0.1
+HOST_BACKOFF_CAP = 30.0
+
+# Seconds to wait for the primary API endpoint before also asking the fallbacks
+API_HEDGE_DELAY = 0.5
+
 # Define fallback API endpoints in case the primary one fails
 KASPA_API_FALLBACKS = [
     "https://api.kaspa.org",
@@ -12,13 +39,31 @@ KASPA_API_FALLBACKS = [
 
 class KasWareService:
     def __init__(self):
-        self.kaspa_api_url = settings.KASPA_API_URL
-        self.transaction_times = {}  # Store transaction start times
+        self._set_api_url(settings.KASPA_API_URL)
+        self.transaction_times: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()  # Store transaction start times, oldest first
         self.fastest_confirmation_time = None
         self.current_api_index = 0  # Track current API endpoint
+        self.confirmation_events: Dict[str, asyncio.Event] = {}  # Wake-ups for tasks waiting on a transaction
+        self._client: Optional[httpx.AsyncClient] = None  # Shared HTTP client, created on first use
+        self._tip_request: Optional[asyncio.Future] = None  # In-flight /info/blockdag request shared by callers
+        # Shared block scanner: lowercased tx ID -> (tx ID, last time it was asked about)
+        self._watched: Dict[str, Tuple[str, float]] = {}
+        self._scan_task: Optional[asyncio.Task] = None
+        self._scan_start: Optional[str] = None  # Block hash the next scan starts from
+        self._scan_error: Optional[str] = None  # Error from the last scan, if it failed
+        self._host_failures: Dict[str, int] = {}  # Consecutive failures per API host
+        self._host_cooldown: Dict[str, float] = {}  # Monotonic time before which a host is skipped
         
         # Log the API URL being used
-        print(f"Initializing KasWareService with API URL: {self.kaspa_api_url}")
+        logger.info("Initializing KasWareService with API URL: %s", self.kaspa_api_url)
+    
+    def _set_api_url(self, url: str) -> None:
+        """
+        Switch the Kaspa API base URL, rebuilding the endpoint URLs polled on every check.
+        """
+        self.kaspa_api_url = url
+        self._url_blockdag = f"{url}/info/blockdag"
+        self._url_blocks = f"{url}/blocks"
     
     async def verify_transaction(self, transaction_id: str, amount_sompi: int, wallet_address: str) -> bool:
         """
@@ -27,52 +72,262 @@ class KasWareService:
         try:
             # This method is not used in the current implementation
             # It's kept for reference or future use
-            print(f"Warning: verify_transaction method is not implemented")
+            logger.warning("verify_transaction method is not implemented")
             return False
             
         except Exception as e:
-            print(f"Error verifying transaction: {e}")
+            logger.error("Error verifying transaction: %s", e)
             return False
     
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """
+        Shared HTTP client so Kaspa API calls reuse pooled keep-alive connections.
+        """
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=5.0,
+                limits=httpx.Limits(max_keepalive_connections=64),
+                # Retry failed connects once before falling back to another endpoint
+                transport=httpx.AsyncHTTPTransport(retries=1)
+            )
+        return self._client
+    
+    async def _fetch_tip_hash(self) -> str:
+        tip_response = await self._try_api_request(self._url_blockdag)
+        return orjson.loads(tip_response.content)["tipHashes"][0]
+    
+    async def _get_tip_hash(self) -> str:
+        """
+        Current DAG tip hash. Concurrent callers share a single request.
+        """
+        if self._tip_request is None or self._tip_request.done():
+            self._tip_request = asyncio.ensure_future(self._fetch_tip_hash())
+        # Shield so one cancelled caller doesn't cancel the request for the others
+        return await asyncio.shield(self._tip_request)
+    
+    def _host_available(self, host: str) -> bool:
+        return time.monotonic() >= self._host_cooldown.get(host, 0.0)
+    
+    def _host_failed(self, host: str) -> None:
+        failures = self._host_failures[host] = self._host_failures.get(host, 0) + 1
+        delay = random.uniform(0, min(HOST_BACKOFF_CAP, HOST_BACKOFF_BASE * 2 ** failures))
+        self._host_cooldown[host] = time.monotonic() + delay
+    
+    def _host_succeeded(self, host: str) -> None:
+        self._host_failures.pop(host, None)
+        self._host_cooldown.pop(host, None)
+    
     async def _try_api_request(self, url, method="GET", **kwargs):
         """
-        Try making a request to an API with retries and fallbacks
+        Request a URL from the current API endpoint, hedged with the fallbacks.
+        The fallbacks join the race if the primary fails or hasn't answered within
+        API_HEDGE_DELAY; the first good response wins. Hosts that keep failing
+        (transport errors or 5xx) are skipped until their backoff expires.
         """
-        # Try the current API endpoint first
+        if method != "GET":
+            raise ValueError(f"Unsupported method {method}")
+        primary = self.kaspa_api_url
+        # The configured URL stays a candidate after switching away from it
+        fallbacks = [
+            host for host in dict.fromkeys([settings.KASPA_API_URL, *KASPA_API_FALLBACKS])
+            if host != primary
+        ]
+        attempts: Dict[asyncio.Task, str] = {}
+        
+        def start(host: str) -> asyncio.Task:
+            task = asyncio.create_task(self.client.get(url.replace(primary, host), **kwargs))
+            attempts[task] = host
+            return task
+        
+        if self._host_available(primary):
+            start(primary)
+            hedged = False
+        else:
+            for host in fallbacks:
+                if self._host_available(host):
+                    start(host)
+            hedged = True
+        pending = set(attempts)
         try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                if method == "GET":
-                    response = await client.get(url, **kwargs)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=None if hedged else API_HEDGE_DELAY, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    host = attempts[task]
+                    try:
+                        response = task.result()
+                    except Exception as e:
+                        logger.warning("API %s request failed: %s", host, e)
+                        self._host_failed(host)
+                        continue
                     if response.status_code == 200:
+                        self._host_succeeded(host)
+                        if host != primary:
+                            # Update the primary API if a fallback works
+                            logger.warning("Fallback API %s is working, using it as primary now", host)
+                            self._set_api_url(host)
                         return response
+                    # Client errors mean the host is up; only server errors count against it
+                    logger.warning("API %s returned %s", host, response.status_code)
+                    if response.status_code >= 500:
+                        self._host_failed(host)
+                if not hedged:
+                    # The primary failed or is slow; race the fallbacks against it
+                    logger.debug("Primary API endpoint failed or is slow, trying fallbacks...")
+                    for host in fallbacks:
+                        if self._host_available(host):
+                            pending.add(start(host))
+                    hedged = True
+        finally:
+            for task in pending:
+                task.cancel()
+        
+        # If we reach here, all APIs failed
+        raise Exception("All Kaspa API endpoints failed")
+    
+    async def _lookup_transaction(self, transaction_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a single transaction by ID. Returns None if the API doesn't know it (yet).
+        """
+        try:
+            response = await self.client.get(
+                f"{self.kaspa_api_url}/transactions/{transaction_id}",
+                params={"inputs": "false", "outputs": "false", "resolve_previous_outpoints": "no"}
+            )
+            if response.status_code == 200:
+                return orjson.loads(response.content)
         except Exception as e:
-            print(f"API request failed: {e}")
+            logger.debug("Transaction lookup failed: %s", e)
+        return None
+    
+    def _record_confirmation(self, transaction_id: str, original_transaction_id: str,
+                             block_hash: Optional[str], block_height: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Mark a transaction as confirmed and return the verification result.
+        """
+        confirmation_time = time.time() - self.transaction_times[transaction_id]["start_time"]
+        
+        # Update transaction data
+        self.transaction_times[transaction_id].update({
+            "confirmed": True,
+            "confirmation_time": confirmation_time,
+            "block_hash": block_hash,
+            "block_height": block_height
+        })
         
-        # If we reach here, the request failed - try fallbacks
-        print(f"Primary API endpoint failed, trying fallbacks...")
+        # Update fastest confirmation time if applicable
+        if (self.fastest_confirmation_time is None or 
+            confirmation_time < self.fastest_confirmation_time):
+            self.fastest_confirmation_time = confirmation_time
         
-        # Try each fallback API
-        for i, fallback in enumerate(KASPA_API_FALLBACKS):
+        self._notify_confirmation(transaction_id, original_transaction_id)
+        
+        return self._confirmed_result(transaction_id)
+    
+    def _confirmed_result(self, transaction_id: str) -> Dict[str, Any]:
+        entry = self.transaction_times[transaction_id]
+        return {
+            "verified": True,
+            "confirmation_time": entry["confirmation_time"],
+            "fastest_time": self.fastest_confirmation_time,
+            "block_hash": entry.get("block_hash"),
+            "block_height": entry.get("block_height")
+        }
+    
+    def _watch(self, transaction_id: str) -> None:
+        """
+        Have the block scanner look for this transaction, starting it if it isn't running.
+        """
+        self._watched[transaction_id.lower()] = (transaction_id, time.time())
+        if self._scan_task is None or self._scan_task.done():
+            self._scan_task = asyncio.create_task(self._scan_loop())
+    
+    async def _scan_loop(self) -> None:
+        """
+        Fetch new blocks once per TRANSACTION_CHECK_INTERVAL and confirm every watched
+        transaction found in them. Stops when nothing is watched any more.
+        """
+        interval = settings.TRANSACTION_CHECK_INTERVAL / 1000
+        while True:
+            # Forget transactions nobody has asked about for a while
+            cutoff = time.time() - SCAN_WATCH_TIMEOUT
+            for key in [k for k, (_, last_seen) in self._watched.items() if last_seen < cutoff]:
+                del self._watched[key]
+            if not self._watched:
+                # Start from the tip next time rather than replaying the idle gap;
+                # the direct lookup still finds transactions confirmed meanwhile
+                self._scan_start = None
+                return
+            
             try:
-                if fallback == self.kaspa_api_url:
-                    continue  # Skip if it's the same as our primary
-                
-                fallback_url = url.replace(self.kaspa_api_url, fallback)
-                print(f"Trying fallback API #{i+1}: {fallback_url}")
-                
-                async with httpx.AsyncClient(timeout=5.0) as client:
-                    if method == "GET":
-                        response = await client.get(fallback_url, **kwargs)
-                        if response.status_code == 200:
-                            # Update the primary API if a fallback works
-                            print(f"Fallback API {fallback} is working, using it as primary now")
-                            self.kaspa_api_url = fallback
-                            return response
+                await self._scan_new_blocks()
+                self._scan_error = None
             except Exception as e:
-                print(f"Fallback API request failed: {e}")
+                logger.warning("Error getting blocks: %s", e)
+                self._scan_error = str(e)
+            
+            await asyncio.sleep(interval)
+    
+    async def _scan_new_blocks(self) -> None:
+        """
+        Check the blocks added since the last scan against all watched transactions.
+        """
+        if self._scan_start is None:
+            # Use the direct Kaspa API endpoint with retry logic; shared with concurrent pollers
+            self._scan_start = await self._get_tip_hash()
+            logger.debug("Set initial scan_start to %s", self._scan_start)
         
-        # If we reach here, all APIs failed
-        raise Exception("All Kaspa API endpoints failed")
+        # Check for new blocks since scan_start with retry logic
+        logger.debug("Checking blocks from %s for %s transactions", self._scan_start, len(self._watched))
+        blocks_response = await self._try_api_request(
+            self._url_blocks,
+            params={"lowHash": self._scan_start, "includeBlocks": "true"}
+        )
+        
+        # Block payloads carry every transaction ID, so parse them with orjson
+        blocks_data = orjson.loads(blocks_response.content)
+        
+        # IMPORTANT FIX: The API returns "blocks" not "keys"
+        for block in blocks_data.get("blocks", []):
+            transaction_ids = self._block_transaction_ids(block)
+            if not transaction_ids:
+                continue
+            
+            # One set intersection per block covers every watched transaction (case-insensitively)
+            for key in {tid.lower() for tid in transaction_ids} & self._watched.keys():
+                transaction_id, _ = self._watched.pop(key)
+                logger.info("Transaction %s confirmed in block %s", transaction_id, block.get("hash"))
+                if transaction_id not in self.transaction_times:
+                    self._track(transaction_id)
+                self._record_confirmation(
+                    transaction_id, transaction_id,
+                    block.get("hash"), block.get("verboseData", {}).get("blockHeight")
+                )
+        
+        # Update scan_start to the latest block hash for next check
+        if blocks_data.get("blockHashes") and len(blocks_data["blockHashes"]) > 0:
+            # Use the last (newest) block hash as the new scan_start
+            self._scan_start = blocks_data["blockHashes"][-1]
+    
+    @staticmethod
+    def _block_transaction_ids(block: Dict[str, Any]) -> List[str]:
+        """
+        Transaction IDs in a block from the /blocks endpoint, whichever layout the API used.
+        """
+        verbose_data = block.get("verboseData") or {}
+        # Classic verboseData.transactionIds
+        if "transactionIds" in verbose_data:
+            return verbose_data["transactionIds"]
+        # Array of transaction objects with an "id" each
+        transactions = block.get("transactions")
+        if isinstance(transactions, list):
+            return [tx["id"] for tx in transactions if isinstance(tx, dict) and "id" in tx]
+        # Some API versions use txIds, or put transactionIds on the block itself
+        if "txIds" in verbose_data:
+            return verbose_data["txIds"]
+        return block.get("transactionIds") or []
     
     async def verify_transaction_in_blockchain(self, transaction_id: str) -> Dict[str, Any]:
         """
@@ -80,251 +335,55 @@ class KasWareService:
         Returns a dictionary with verification status and performance metrics.
         """
         try:
-            # Clean up transaction ID if needed
-            if isinstance(transaction_id, str):
-                # Store original ID for debugging
-                original_transaction_id = transaction_id
-                
+            # Store original ID for debugging
+            original_transaction_id = transaction_id
+            
+            # Clean up transaction ID if needed; plain 64-hex IDs are already clean.
+            # JSON-wrapped IDs are rejected by the API routes, so only quotes and whitespace remain.
+            if isinstance(transaction_id, str) and not TX_ID_PATTERN.fullmatch(transaction_id):
                 # Remove any quotes or whitespace
                 transaction_id = transaction_id.strip().strip('"\'')
-                
-                # Handle JSON object case
-                if transaction_id.startswith('{') and transaction_id.endswith('}'):
-                    import json
-                    try:
-                        tx_data = json.loads(transaction_id)
-                        if 'id' in tx_data:
-                            transaction_id = tx_data['id']
-                            print(f"***** Successfully extracted transaction ID from JSON: {transaction_id} *****")
-                        elif 'transactionId' in tx_data:
-                            transaction_id = tx_data['transactionId']
-                            print(f"***** Successfully extracted transaction ID from JSON: {transaction_id} *****")
-                        else:
-                            # Check all keys recursively
-                            def find_id_in_dict(d, prefix=""):
-                                for k, v in d.items():
-                                    if k == 'id' or k == 'transactionId':
-                                        return v
-                                    elif isinstance(v, dict):
-                                        result = find_id_in_dict(v, prefix=f"{prefix}.{k}")
-                                        if result:
-                                            return result
-                                return None
-                            
-                            found_id = find_id_in_dict(tx_data)
-                            if found_id:
-                                transaction_id = found_id
-                                print(f"***** Found transaction ID in nested JSON: {transaction_id} *****")
-                            else:
-                                print(f"JSON object does not contain 'id' or 'transactionId' field. Available keys: {list(tx_data.keys())}")
-                    except json.JSONDecodeError as e:
-                        print(f"Error parsing transaction ID as JSON: {e}")
-                        # Continue with original ID if JSON parsing fails
             
-            print(f"Verifying transaction: {transaction_id}")
+            logger.debug("Verifying transaction: %s", transaction_id)
             # If the original and cleaned IDs differ, log both
-            if 'original_transaction_id' in locals() and original_transaction_id != transaction_id:
-                print(f"Original transaction ID before cleaning: {original_transaction_id}")
+            if original_transaction_id != transaction_id:
+                logger.debug("Original transaction ID before cleaning: %s", original_transaction_id)
             
             # Record start time if not already recorded
             if transaction_id not in self.transaction_times:
-                self.transaction_times[transaction_id] = {
-                    "start_time": time.time(),
-                    "confirmed": False,
-                    "confirmation_time": None,
-                    "scan_start": None
-                }
+                self._track(transaction_id)
             
-            # Try to get the tip hash with retries and fallbacks
-            try:
-                if not self.transaction_times[transaction_id].get("scan_start"):
-                    # Use the direct Kaspa API endpoint with retry logic
-                    tip_response = await self._try_api_request(f"{self.kaspa_api_url}/info/blockdag")
-                    tip_hash = tip_response.json()["tipHashes"][0]
-                    self.transaction_times[transaction_id]["scan_start"] = tip_hash
-                    print(f"Set initial scan_start to {tip_hash} for transaction {transaction_id}")
-                
-                # Get the current scan_start
-                scan_start = self.transaction_times[transaction_id]["scan_start"]
-                
-                # Check for new blocks since scan_start with retry logic
-                print(f"Checking blocks from {scan_start} for transaction {transaction_id}")
-                blocks_response = await self._try_api_request(
-                    f"{self.kaspa_api_url}/blocks",
-                    params={"lowHash": scan_start, "includeBlocks": "true"}
+            # Already confirmed, e.g. by the block scanner
+            if self.transaction_times[transaction_id]["confirmed"]:
+                return self._confirmed_result(transaction_id)
+            
+            # Fast path: ask the API for the transaction itself instead of downloading blocks
+            tx_data = await self._lookup_transaction(transaction_id)
+            if tx_data and tx_data.get("block_hash"):
+                logger.info("Transaction %s confirmed in block %s (direct lookup)", transaction_id, tx_data["block_hash"][0])
+                return self._record_confirmation(
+                    transaction_id, original_transaction_id, tx_data["block_hash"][0]
                 )
-                
-                blocks_data = blocks_response.json()
-                
-                # Debug: Print the structure of blocks_data
-                print(f"Blocks data structure: {list(blocks_data.keys())}")
-                # Print a sample of the blocks response to understand the structure
-                if blocks_data.get("blocks") and len(blocks_data.get("blocks", [])) > 0:
-                    sample_block = blocks_data["blocks"][0]
-                    print(f"Sample block structure: {list(sample_block.keys())}")
-                    if "verboseData" in sample_block:
-                        print(f"Sample verboseData structure: {list(sample_block['verboseData'].keys())}")
-                        # Check if transactionIds exists
-                        if "transactionIds" in sample_block["verboseData"]:
-                            print(f"transactionIds exists with {len(sample_block['verboseData']['transactionIds'])} transactions")
-                        else:
-                            print(f"transactionIds key missing from verboseData. Available keys: {list(sample_block['verboseData'].keys())}")
-                    else:
-                        print(f"verboseData key missing from block. Available keys: {list(sample_block.keys())}")
-                else:
-                    print(f"No blocks found in response or blocks key missing. Full response keys: {list(blocks_data.keys())}")
-                
-                # Update scan_start to the latest block hash for next check
-                if blocks_data.get("blockHashes") and len(blocks_data["blockHashes"]) > 0:
-                    # Use the last (newest) block hash as the new scan_start
-                    new_scan_start = blocks_data["blockHashes"][-1]
-                    self.transaction_times[transaction_id]["scan_start"] = new_scan_start
-                    print(f"Updated scan_start to {new_scan_start} for transaction {transaction_id}")
-            except Exception as e:
-                print(f"Error getting blocks: {e}")
-                raise e  # Re-raise to be caught by the outer exception handler
-                
-            # Check if transaction is in any of the blocks
-            found = False
             
-            # IMPORTANT FIX: The API returns "blocks" not "keys"
-            for block in blocks_data.get("blocks", []):
-                # Try different possible paths for transaction IDs
-                transaction_ids = []
-                
-                # Path 1: Classic verboseData.transactionIds
-                if "verboseData" in block and "transactionIds" in block["verboseData"]:
-                    transaction_ids = block["verboseData"]["transactionIds"]
-                    print(f"Found transactionIds in verboseData with {len(transaction_ids)} transactions")
-                
-                # Path 2: Check if transactions array exists
-                elif "transactions" in block:
-                    print(f"Found 'transactions' array with {len(block['transactions'])} entries")
-                    # Extract IDs from transactions if it's an array of objects
-                    if isinstance(block["transactions"], list) and len(block["transactions"]) > 0:
-                        if isinstance(block["transactions"][0], dict) and "id" in block["transactions"][0]:
-                            transaction_ids = [tx["id"] for tx in block["transactions"] if "id" in tx]
-                            print(f"Extracted {len(transaction_ids)} transaction IDs from transactions array")
-                
-                # Path 3: Check if the API returns txIds instead
-                elif "verboseData" in block and "txIds" in block["verboseData"]:
-                    transaction_ids = block["verboseData"]["txIds"]
-                    print(f"Found txIds in verboseData with {len(transaction_ids)} transactions")
-                    
-                # Path 4: Direct transactionIds at block level
-                elif "transactionIds" in block:
-                    transaction_ids = block["transactionIds"]
-                    print(f"Found transactionIds directly in block with {len(transaction_ids)} transactions")
-                
-                # Debug: print block structure if no transaction IDs found
-                if not transaction_ids:
-                    print(f"No transaction IDs found in block. Block keys: {list(block.keys())}")
-                    if "verboseData" in block:
-                        print(f"VerboseData keys: {list(block['verboseData'].keys())}")
-                    continue
-                
-                print(f"Checking block {block.get('hash', 'unknown')} with {len(transaction_ids)} transactions")
-                
-                # Print the first few transaction IDs for debugging
-                if len(transaction_ids) > 0:
-                    print(f"First few transaction IDs in block: {transaction_ids[:3]}")
-                    print(f"Looking for transaction ID: {transaction_id}")
-                
-                # Primary check: exact match
-                if transaction_id in transaction_ids:
-                    found = True
-                    print(f"FOUND MATCH! Transaction {transaction_id} in block {block.get('hash', 'unknown')}")
-                    
-                    # Transaction found in a block, mark as confirmed
-                    end_time = time.time()
-                    confirmation_time = end_time - self.transaction_times[transaction_id]["start_time"]
-                    
-                    # Update transaction data
-                    self.transaction_times[transaction_id]["confirmed"] = True
-                    self.transaction_times[transaction_id]["confirmation_time"] = confirmation_time
-                    
-                    # Update fastest confirmation time if applicable
-                    if (self.fastest_confirmation_time is None or 
-                        confirmation_time < self.fastest_confirmation_time):
-                        self.fastest_confirmation_time = confirmation_time
-                    
-                    return {
-                        "verified": True,
-                        "confirmation_time": confirmation_time,
-                        "fastest_time": self.fastest_confirmation_time,
-                        "block_hash": block.get("hash"),
-                        "block_height": block.get("verboseData", {}).get("blockHeight")
-                    }
-                
-                # Secondary check: case-insensitive match (in case of capitalization differences)
-                if not found and any(tid.lower() == transaction_id.lower() for tid in transaction_ids):
-                    found = True
-                    matching_tid = next(tid for tid in transaction_ids if tid.lower() == transaction_id.lower())
-                    print(f"FOUND CASE-INSENSITIVE MATCH! Transaction {matching_tid} matches {transaction_id}")
-                    
-                    # Transaction found in a block, mark as confirmed
-                    end_time = time.time()
-                    confirmation_time = end_time - self.transaction_times[transaction_id]["start_time"]
-                    
-                    # Update transaction data
-                    self.transaction_times[transaction_id]["confirmed"] = True
-                    self.transaction_times[transaction_id]["confirmation_time"] = confirmation_time
-                    
-                    # Update fastest confirmation time if applicable
-                    if (self.fastest_confirmation_time is None or 
-                        confirmation_time < self.fastest_confirmation_time):
-                        self.fastest_confirmation_time = confirmation_time
-                    
-                    return {
-                        "verified": True,
-                        "confirmation_time": confirmation_time,
-                        "fastest_time": self.fastest_confirmation_time,
-                        "block_hash": block.get("hash"),
-                        "block_height": block.get("verboseData", {}).get("blockHeight")
-                    }
-                
-                # Tertiary check: check if transaction ID is a substring of any transaction ID in the block
-                # This handles the case where the API might return longer format IDs
-                if not found and any(transaction_id in tid for tid in transaction_ids):
-                    found = True
-                    matching_tid = next(tid for tid in transaction_ids if transaction_id in tid)
-                    print(f"FOUND SUBSTRING MATCH! Transaction {matching_tid} contains {transaction_id}")
-                    
-                    # Transaction found in a block, mark as confirmed
-                    end_time = time.time()
-                    confirmation_time = end_time - self.transaction_times[transaction_id]["start_time"]
-                    
-                    # Update transaction data
-                    self.transaction_times[transaction_id]["confirmed"] = True
-                    self.transaction_times[transaction_id]["confirmation_time"] = confirmation_time
-                    
-                    # Update fastest confirmation time if applicable
-                    if (self.fastest_confirmation_time is None or 
-                        confirmation_time < self.fastest_confirmation_time):
-                        self.fastest_confirmation_time = confirmation_time
-                    
-                    return {
-                        "verified": True,
-                        "confirmation_time": confirmation_time,
-                        "fastest_time": self.fastest_confirmation_time,
-                        "block_hash": block.get("hash"),
-                        "block_height": block.get("verboseData", {}).get("blockHeight")
-                    }
+            # Fall back to the shared block scanner, which checks new blocks for every
+            # watched transaction with one /blocks request per interval
+            self._watch(transaction_id)
+            if self._scan_error:
+                raise Exception(self._scan_error)
             
-            if not found:
-                print(f"Transaction {transaction_id} not found in any blocks yet")
+            logger.debug("Transaction %s not found in any blocks yet", transaction_id)
             
             # Transaction not found in any block yet
             return {
                 "verified": False,
                 "message": "Transaction not found in any block yet",
-                "scan_start": self.transaction_times[transaction_id]["scan_start"]
+                "scan_start": self._scan_start
             }
         
         except Exception as e:
-            print(f"Error verifying transaction in blockchain: {e}")
-            import traceback
-            traceback.print_exc()
+            # Only pay for the traceback when someone is debugging
+            logger.warning("Error verifying transaction in blockchain: %s", e,
+                           exc_info=logger.isEnabledFor(logging.DEBUG))
             
             # Create a descriptive error message
             error_msg = str(e)
@@ -341,15 +400,50 @@ class KasWareService:
                 "transaction_recorded": True # Let the frontend know the transaction was recorded
             }
     
+    def _notify_confirmation(self, *transaction_ids: str) -> None:
+        """
+        Wake up any tasks waiting in wait_for_tx for these transaction IDs.
+        """
+        for tx_id in transaction_ids:
+            event = self.confirmation_events.get(tx_id)
+            if event is not None:
+                event.set()
+    
+    async def wait_for_tx(self, transaction_id: str, timeout: float) -> bool:
+        """
+        Wait up to `timeout` seconds for the transaction to be confirmed by another
+        verification call (e.g. the frontend polling the verify endpoint).
+        Returns True if a confirmation arrived while waiting.
+        """
+        event = self.confirmation_events.setdefault(transaction_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            if self.confirmation_events.get(transaction_id) is event:
+                del self.confirmation_events[transaction_id]
+    
     async def start_transaction_timer(self, transaction_id: str) -> None:
         """
         Start timing a transaction for performance measurement.
         """
-        self.transaction_times[transaction_id] = {
+        self.transaction_times.pop(transaction_id, None)
+        self._track(transaction_id)
+    
+    def _track(self, transaction_id: str) -> Dict[str, Any]:
+        """
+        Start a transaction_times entry, evicting the oldest once there are too many.
+        """
+        entry = self.transaction_times[transaction_id] = {
             "start_time": time.time(),
             "confirmed": False,
             "confirmation_time": None
         }
+        while len(self.transaction_times) > TRANSACTION_TIMES_MAX:
+            self.transaction_times.popitem(last=False)
+        return entry
     
     def get_transaction_metrics(self, transaction_id: str = None) -> Dict[str, Any]:
         """
@@ -358,9 +452,13 @@ class KasWareService:
         if transaction_id:
             return self.transaction_times.get(transaction_id, {})
         
+        # Summarize instead of handing back every tracked transaction
+        times = [entry["confirmation_time"] for entry in self.transaction_times.values() if entry["confirmed"]]
         return {
-            "transactions": self.transaction_times,
-            "fastest_confirmation_time": self.fastest_confirmation_time
+            "fastest_time": self.fastest_confirmation_time,
+            "average_time": sum(times) / len(times) if times else None,
+            "total_transactions": len(self.transaction_times),
+            "confirmed_transactions": len(times)
         }
     
     async def get_wallet_balance(self, wallet_address: str) -> Optional[int]:
@@ -370,20 +468,23 @@ class KasWareService:
         try:
             # This method is not used in the current implementation
             # It's kept for reference or future use
-            print(f"Warning: get_wallet_balance method is not implemented")
+            logger.warning("get_wallet_balance method is not implemented")
             return None
             
         except Exception as e:
-            print(f"Error getting wallet balance: {e}")
+            logger.error("Error getting wallet balance: %s", e)
             return None
     
     async def close(self):
         """
-        Close the HTTP client session.
+        Stop the block scanner and close the HTTP client session.
         """
-        # This method is not used in the current implementation
-        # It's kept for reference or future use
-        print(f"Warning: close method is not implemented")
+        if self._scan_task is not None:
+            self._scan_task.cancel()
+            self._scan_task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
 
 # Create a global instance
 kasware_service = KasWareService() 
\ No newline at end of file
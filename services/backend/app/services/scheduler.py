@@ -0,0 +1,108 @@
+from typing import Any, Awaitable, Callable, Deque, Set, Tuple
+from collections import deque
+import asyncio
+import logging
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+Job = Tuple[Callable[..., Awaitable[Any]], tuple, int]  # (function, args, attempt)
+
+class TaskScheduler:
+    """
+    Runs background jobs on the event loop with a cap on how many run at once.
+    Jobs beyond the cap wait in a bounded queue; when it is full the oldest
+    waiting job is dropped. Failed jobs are retried with exponential backoff.
+    Spawning a job that is already queued, running or waiting to retry is a no-op.
+    """
+    def __init__(self, limit: int, pending_limit: int, max_retries: int = 0, retry_delay: float = 1.0):
+        self.limit = limit
+        self.pending_limit = pending_limit
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._pending: Deque[Job] = deque()
+        self._running: Set[asyncio.Task] = set()
+        self._retry_handles: Set[asyncio.TimerHandle] = set()
+        self._scheduled: Set[Tuple[Callable[..., Awaitable[Any]], tuple]] = set()  # (function, args) not yet finished
+
+    @property
+    def active_count(self) -> int:
+        return len(self._running)
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def spawn(self, func: Callable[..., Awaitable[Any]], *args: Any) -> None:
+        """
+        Schedule func(*args). Returns immediately; must be called from the event loop.
+        """
+        if (func, args) in self._scheduled:
+            logger.debug("Job %s%s already scheduled, not spawning it again", func.__name__, args)
+            return
+        self._scheduled.add((func, args))
+        self._submit((func, args, 0))
+
+    def _submit(self, job: Job) -> None:
+        if len(self._pending) >= self.pending_limit:
+            dropped_func, dropped_args, _ = self._pending.popleft()
+            self._scheduled.discard((dropped_func, dropped_args))
+            logger.warning("Scheduler queue full, dropping oldest job: %s%s", dropped_func.__name__, dropped_args)
+        self._pending.append(job)
+        self._fill()
+
+    def _fill(self) -> None:
+        while self._pending and len(self._running) < self.limit:
+            job = self._pending.popleft()
+            task = asyncio.create_task(self._run(job))
+            self._running.add(task)
+            task.add_done_callback(self._on_done)
+
+    def _on_done(self, task: asyncio.Task) -> None:
+        self._running.discard(task)
+        self._fill()
+
+    async def _run(self, job: Job) -> None:
+        func, args, attempt = job
+        try:
+            await func(*args)
+        except asyncio.CancelledError:
+            self._scheduled.discard((func, args))
+            raise
+        except Exception as e:
+            if attempt >= self.max_retries:
+                logger.warning("Background job %s%s failed after %s attempts: %s", func.__name__, args, attempt + 1, e)
+                self._scheduled.discard((func, args))
+                return
+            delay = self.retry_delay * 2 ** attempt
+            logger.debug("Background job %s%s failed, retrying in %ss: %s", func.__name__, args, delay, e)
+            # Wait outside the concurrency slot so retries don't block other jobs
+            handle = None
+            def resubmit():
+                self._retry_handles.discard(handle)
+                self._submit((func, args, attempt + 1))
+            handle = asyncio.get_running_loop().call_later(delay, resubmit)
+            self._retry_handles.add(handle)
+        else:
+            self._scheduled.discard((func, args))
+
+    async def close(self) -> None:
+        """
+        Cancel running jobs and forget pending ones.
+        """
+        self._pending.clear()
+        self._scheduled.clear()
+        for handle in self._retry_handles:
+            handle.cancel()
+        self._retry_handles.clear()
+        tasks = list(self._running)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+# Create a global instance for transaction verification jobs
+verification_scheduler = TaskScheduler(
+    limit=settings.VERIFY_CONCURRENCY,
+    pending_limit=settings.VERIFY_PENDING_LIMIT,
+    max_retries=settings.VERIFY_MAX_RETRIES,
+)
@@ -12,9 +12,13 @@ import asyncio
 import random
 import string
 from datetime import datetime
-from sqlalchemy import text
+from functools import lru_cache
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 import traceback
 
+import numpy as np
+
 # Add the parent directory to the path so we can import the app modules
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
@@ -77,6 +81,9 @@ LETTER_PATTERNS = {
     ]
 }
 
+# The same patterns as arrays, converted once
+LETTER_ARRAYS = {letter: np.array(pattern, dtype=np.uint8) for letter, pattern in LETTER_PATTERNS.items()}
+
 # Grid size (size of each pixel cell)
 GRID_SIZE = 10
 
@@ -86,99 +93,97 @@ def generate_transaction_id():
     random_str = ''.join(random.choices(string.ascii_lowercase + string.digits, k=8))
     return f"direct-placement-{timestamp}-{random_str}"
 
-async def place_pixel(db, x, y, color, wallet_address):
-    """Place a pixel directly in the database and broadcast the update."""
+async def place_pixels(db, pixels, color, wallet_address):
+    """Place many (x, y) pixels in one statement and broadcast them as one batch."""
+    if not pixels:
+        return 0
     try:
-        # Generate a unique transaction ID
-        transaction_id = generate_transaction_id()
-        
-        # Create new pixel
-        pixel = Pixel(
-            x=x,
-            y=y,
-            color=color,
-            wallet_address=wallet_address,
-            transaction_id=transaction_id
+        # A cell can hold only one pixel, so replace whatever is already there
+        stmt = pg_insert(Pixel)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Pixel.x, Pixel.y],
+            set_={
+                "color": stmt.excluded.color,
+                "wallet_address": stmt.excluded.wallet_address,
+                "transaction_id": stmt.excluded.transaction_id,
+                "created_at": func.now(),
+            },
         )
-        
-        # Save to database
-        db.add(pixel)
+        # One generated ID for the batch; the pixel index keeps each row's ID unique
+        batch_id = generate_transaction_id()
+        db.execute(stmt, [
+            {
+                "x": x,
+                "y": y,
+                "color": color,
+                "wallet_address": wallet_address,
+                "transaction_id": f"{batch_id}-{i}",
+            }
+            for i, (x, y) in enumerate(pixels)
+        ])
         db.commit()
-        db.refresh(pixel)
         
         # Broadcast update to all connected clients
-        print(f"Broadcasting pixel update: x={x}, y={y}, color={color}")
-        await manager.broadcast_pixel_update(x, y, color)
+        print(f"Broadcasting {len(pixels)} pixel updates")
+        manager.enqueue_pixel_batch([(x, y, color) for x, y in pixels])
         
-        return pixel
+        return len(pixels)
     except Exception as e:
         db.rollback()
-        print(f"Error placing pixel: {e}")
-        return None
+        print(f"Error placing pixels: {e}")
+        return 0
 
-async def place_scaled_pattern(db, pattern, start_x, start_y, color, wallet_address, scale_factor):
-    """Place a scaled pattern of pixels."""
-    pixels_placed = 0
+def scaled_pattern_coords(pattern, start_x, start_y, scale_factor):
+    """(x, y) of every pixel in a pattern scaled up by scale_factor."""
+    # Blow each '1' in the pattern up into a scale_factor x scale_factor block
+    mask = np.kron(np.asarray(pattern, dtype=np.uint8), np.ones((scale_factor, scale_factor), dtype=np.uint8))
+    ys, xs = np.nonzero(mask)
+    return list(zip((xs + start_x).tolist(), (ys + start_y).tolist()))
+
+@lru_cache(maxsize=8)
+def kaspa_coords(scale_factor, canvas_width, canvas_height):
+    """(x, y) of every pixel of "KASPA" centered on the canvas; depends only on the arguments."""
+    # Calculate the center of the canvas
+    center_x = canvas_width // 2
+    center_y = canvas_height // 2
+    
+    # Calculate the total width of "KASPA" with spacing
+    letter_spacing = 3 * scale_factor  # Spacing between letters in grid cells, scaled
+    word = "KASPA"
+    
+    # Calculate total width of the word (scaled)
+    total_width = 0
+    for letter in word:
+        pattern = LETTER_PATTERNS[letter]
+        total_width += len(pattern[0]) * scale_factor
+        if letter != word[-1]:
+            total_width += letter_spacing
+    
+    # Calculate starting X position to center the word
+    start_x = center_x - (total_width // 2)
+    # 10 is the height of our letter patterns
+    start_y = center_y - ((10 * scale_factor) // 2)
     
-    for y in range(len(pattern)):
-        for x in range(len(pattern[0])):
-            if pattern[y][x] == 1:
-                # For each '1' in the pattern, place a block of pixels based on the scale factor
-                for scale_y in range(scale_factor):
-                    for scale_x in range(scale_factor):
-                        pixel_x = start_x + (x * scale_factor) + scale_x
-                        pixel_y = start_y + (y * scale_factor) + scale_y
-                        
-                        # Place the pixel
-                        pixel = await place_pixel(db, pixel_x, pixel_y, color, wallet_address)
-                        if pixel:
-                            pixels_placed += 1
-                        
-                        # Add a small delay to avoid overwhelming the server
-                        await asyncio.sleep(0.01)
+    # Lay out each letter
+    current_x = start_x
+    coords = []
     
-    return pixels_placed
+    for letter in word:
+        pattern = LETTER_ARRAYS[letter]
+        coords.extend(scaled_pattern_coords(pattern, current_x, start_y, scale_factor))
+        
+        # Move to the next letter position
+        current_x += (len(pattern[0]) * scale_factor) + letter_spacing
+    
+    return tuple(coords)
 
 async def place_kaspa(color="#70C7BA", wallet_address="admin-direct-placement", scale_factor=10):
     """Place "KASPA" across the center of the canvas with a specified scale factor."""
     db = SessionLocal()
     try:
-        # Calculate the center of the canvas
-        center_x = settings.CANVAS_WIDTH // 2
-        center_y = settings.CANVAS_HEIGHT // 2
-        
-        # Calculate the total width of "KASPA" with spacing
-        letter_spacing = 3 * scale_factor  # Spacing between letters in grid cells, scaled
-        word = "KASPA"
-        
-        # Calculate total width of the word (scaled)
-        total_width = 0
-        for letter in word:
-            pattern = LETTER_PATTERNS[letter]
-            total_width += len(pattern[0]) * scale_factor
-            if letter != word[-1]:
-                total_width += letter_spacing
-        
-        # Calculate starting X position to center the word
-        start_x = center_x - (total_width // 2)
-        # 10 is the height of our letter patterns
-        start_y = center_y - ((10 * scale_factor) // 2)
-        
-        # Place each letter
-        current_x = start_x
-        total_pixels_placed = 0
-        
-        for letter in word:
-            pattern = LETTER_PATTERNS[letter]
-            
-            # Place pixels for this letter with scaling
-            pixels_placed = await place_scaled_pattern(
-                db, pattern, current_x, start_y, color, wallet_address, scale_factor
-            )
-            total_pixels_placed += pixels_placed
-            
-            # Move to the next letter position
-            current_x += (len(pattern[0]) * scale_factor) + letter_spacing
+        # Write the whole word at once instead of one commit per pixel
+        pixels = kaspa_coords(scale_factor, settings.CANVAS_WIDTH, settings.CANVAS_HEIGHT)
+        total_pixels_placed = await place_pixels(db, pixels, color, wallet_address)
         
         print(f"Successfully placed {total_pixels_placed} pixels to form 'KASPA' on the canvas at {scale_factor}x scale!")
     except Exception as e:
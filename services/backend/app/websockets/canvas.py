@@ -0,0 +1,200 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import os
+import struct
+import zlib
+
+import numpy as np
+
+# Wire format for a single pixel: little-endian x, y and packed 0xRRGGBBAA color
+PIXEL_RECORD_DTYPE = np.dtype([("x", "<u2"), ("y", "<u2"), ("color", "<u4")])
+
+def pack_color(color: str) -> int:
+    """
+    Pack a "#rgb", "#rrggbb" or "#rrggbbaa" color into a 0xRRGGBBAA integer.
+    Raises ValueError for anything else.
+    """
+    value = color[1:] if color.startswith("#") else color
+    if len(value) == 3:
+        value = "".join(c * 2 for c in value)
+    if len(value) == 6:
+        value += "ff"
+    if len(value) != 8:
+        raise ValueError(f"Invalid color: {color!r}")
+    packed = int(value, 16)
+    if packed & 0xFF == 0:
+        raise ValueError(f"Fully transparent color: {color!r}")
+    return packed
+
+def unpack_color(packed: int) -> str:
+    """
+    Turn a packed 0xRRGGBBAA integer back into a "#rrggbb" (or "#rrggbbaa") string.
+    """
+    if packed & 0xFF == 0xFF:
+        return f"#{packed >> 8:06x}"
+    return f"#{packed:08x}"
+
+class Canvas:
+    """
+    Canvas colors stored in a height x width uint32 array, one packed RGBA value
+    per cell. Zero means the cell has never been painted.
+    """
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.grid = np.zeros((height, width), dtype=np.uint32)
+        self._dict_cache: Optional[Dict[str, str]] = None
+        self._changed: Optional[np.ndarray] = None  # Cells written since track_changes(), while reloading
+        # Bumped on every change; the random epoch keeps versions from different processes apart
+        self.epoch = os.urandom(4).hex()
+        self.version = 0
+
+    @property
+    def etag(self) -> str:
+        return f"{self.epoch}-{self.version}"
+
+    def contains(self, x: int, y: int) -> bool:
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def set(self, x: int, y: int, color: str) -> int:
+        """
+        Paint one cell; returns the packed color stored.
+        """
+        packed = pack_color(color)
+        self.grid[y, x] = packed
+        if self._changed is not None:
+            self._changed[y, x] = True
+        self._dict_cache = None
+        self.version += 1
+        return packed
+
+    def set_many(self, pixels: Iterable[Tuple[int, int, str]]) -> int:
+        """
+        Set many (x, y, color) pixels with a single array assignment. Pixels with
+        out-of-range coordinates or invalid colors are skipped; returns how many were set.
+        """
+        xs, ys, values = [], [], []
+        for x, y, color in pixels:
+            if not self.contains(x, y):
+                continue
+            try:
+                values.append(pack_color(color))
+            except ValueError:
+                continue
+            xs.append(x)
+            ys.append(y)
+        self.set_packed(xs, ys, values)
+        return len(values)
+
+    def set_packed(self, xs: List[int], ys: List[int], values: List[int]):
+        """
+        Store already validated and packed colors with a single array assignment.
+        """
+        if values:
+            self.grid[ys, xs] = np.array(values, dtype=np.uint32)
+            if self._changed is not None:
+                self._changed[ys, xs] = True
+            self._dict_cache = None
+            self.version += 1
+
+    def adopt(self, other: "Canvas"):
+        """
+        Take over the cells of a canvas loaded elsewhere (e.g. in a worker thread).
+        Cells painted on this canvas in the meantime keep their newer color.
+        """
+        grid = other.grid.copy()
+        painted = self.grid != 0
+        grid[painted] = self.grid[painted]
+        self.grid = grid
+        self._dict_cache = None
+        self.version += 1
+
+    def track_changes(self):
+        """
+        Start remembering which cells are written, so replace() can keep them.
+        """
+        self._changed = np.zeros(self.grid.shape, dtype=bool)
+
+    def stop_tracking(self):
+        self._changed = None
+
+    def replace(self, other: "Canvas"):
+        """
+        Take over the cells of a canvas loaded elsewhere, dropping everything else.
+        Cells written since track_changes() keep their newer color, since the other
+        canvas may have been read before they were placed.
+        """
+        grid = other.grid.copy()
+        if self._changed is not None:
+            grid[self._changed] = self.grid[self._changed]
+            self._changed = None
+        self.grid = grid
+        self._dict_cache = None
+        self.version += 1
+
+    def clear(self):
+        self.grid.fill(0)
+        self._dict_cache = None
+        self.version += 1
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self.grid))
+
+    def to_dict(self) -> Dict[str, str]:
+        """
+        Painted cells as the {"x,y": color} mapping the frontend expects.
+        """
+        if self._dict_cache is None:
+            ys, xs = np.nonzero(self.grid)
+            values = self.grid[ys, xs]
+            self._dict_cache = {
+                f"{x},{y}": unpack_color(int(v))
+                for x, y, v in zip(xs.tolist(), ys.tolist(), values.tolist())
+            }
+        return self._dict_cache
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        """
+        Painted cells as a list of {"x", "y", "color"} dicts.
+        """
+        ys, xs = np.nonzero(self.grid)
+        values = self.grid[ys, xs]
+        return [
+            {"x": x, "y": y, "color": unpack_color(v)}
+            for x, y, v in zip(xs.tolist(), ys.tolist(), values.tolist())
+        ]
+
+    def to_records(self) -> bytes:
+        """
+        Painted cells as packed little-endian (x: u16, y: u16, color: u32) records, 8 bytes each.
+        """
+        ys, xs = np.nonzero(self.grid)
+        records = np.empty(len(xs), dtype=PIXEL_RECORD_DTYPE)
+        records["x"] = xs
+        records["y"] = ys
+        records["color"] = self.grid[ys, xs]
+        return records.tobytes()
+
+    def to_bytes(self) -> bytes:
+        """
+        Raw RGBA bytes, row by row.
+        """
+        return self.grid.astype(">u4").tobytes()
+
+    def to_png(self) -> bytes:
+        """
+        The canvas as an RGBA PNG; unpainted cells are transparent.
+        """
+        rgba = self.grid.astype(">u4").view(np.uint8).reshape(self.height, self.width * 4)
+        # Every scanline starts with filter type 0 (none)
+        raw = np.hstack([np.zeros((self.height, 1), dtype=np.uint8), rgba]).tobytes()
+
+        def chunk(kind: bytes, data: bytes) -> bytes:
+            return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+        header = struct.pack(">IIBBBBB", self.width, self.height, 8, 6, 0, 0, 0)
+        return (
+            b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", header)
+            + chunk(b"IDAT", zlib.compress(raw, 6))
+            + chunk(b"IEND", b"")
+        )
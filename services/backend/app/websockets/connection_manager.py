@@ -1,197 +1,273 @@
-from typing import Dict
+from typing import Dict, List, Optional, Set, Tuple, Union
 from fastapi import WebSocket
 from starlette.websockets import WebSocketDisconnect
-import json
+import orjson
 from app.core.config import settings
+from app.websockets.canvas import Canvas, pack_color
 import asyncio
+import logging
+import struct
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# Pixels go out as binary frames: one kind byte, then little-endian (x: u16, y: u16,
+# color: u32 0xRRGGBBAA) records, 8 bytes per pixel. Updates are applied on top of the
+# client's canvas; a snapshot replaces it and its records are zlib-compressed.
+PIXEL_RECORD = struct.Struct("<HHI")
+FRAME_PIXEL_UPDATES = b"\x00"
+FRAME_CANVAS_SNAPSHOT = b"\x01"
+
+# Snapshots are compressed once per canvas version and shared by every client, instead of
+# per-message deflate recompressing each frame per connection; level 1 keeps it a few ms
+SNAPSHOT_COMPRESSION_LEVEL = 1
+
+# Clients only send small JSON control messages; anything larger closes the connection.
+# uvicorn's --ws-max-size rejects such frames before they are buffered in production.
+MAX_CLIENT_MESSAGE_BYTES = 4096
+
+# Reply to the frontend's keepalive pings; it never changes, so encode it once.
+# The server's own keepalive is uvicorn's protocol-level ping (--ws-ping-interval).
+PONG = orjson.dumps({"type": "pong"}).decode()
 
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
-        self.canvas_state: Dict[str, str] = {}  # (x,y) -> color
-        print("ConnectionManager initialized")
+        # Per-client state is keyed by the socket itself, which hashes by identity
+        self.active_connections: Set[WebSocket] = set()
+        self.canvas = Canvas(settings.CANVAS_WIDTH, settings.CANVAS_HEIGHT)  # Latest color of every pixel
+        self.send_queues: Dict[WebSocket, asyncio.Queue] = {}  # Outgoing messages per client
+        self.sender_tasks: Dict[WebSocket, asyncio.Task] = {}  # Background task draining each queue
+        self.pending_pixels: Dict[int, int] = {}  # Packed colors waiting for the current batch window, keyed by (x << 16) | y
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._canvas_frame: Optional[Tuple[str, bytes]] = None  # (canvas etag, encoded snapshot frame)
     
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        client_id = str(id(websocket))  # Convert to string for better stability
-        self.active_connections[client_id] = websocket
-        print(f"WebSocket client connected: {client_id}. Total connections: {len(self.active_connections)}")
-        
-        # Debug active connections
-        print(f"Active connection IDs: {list(self.active_connections.keys())}")
+        self.active_connections.add(websocket)
+        logger.info("WebSocket client connected: %s. Total connections: %s", id(websocket), len(self.active_connections))
         
         # Send initial canvas state
         await self.send_canvas_state(websocket)
+        
+        # Everything after the initial state goes through the client's queue
+        self._start_sender(websocket)
     
     async def disconnect(self, websocket: WebSocket):
-        client_id = str(id(websocket))  # Convert to string for better stability
-        if client_id in self.active_connections:
-            del self.active_connections[client_id]
-            print(f"WebSocket client disconnected: {client_id}. Remaining connections: {len(self.active_connections)}")
-            print(f"Remaining connection IDs: {list(self.active_connections.keys())}")
+        if websocket in self.active_connections:
+            self.active_connections.discard(websocket)
+            logger.info("WebSocket client disconnected: %s. Remaining connections: %s", id(websocket), len(self.active_connections))
+        self._stop_sender(websocket)
+    
+    def _canvas_state_frame(self) -> bytes:
+        """
+        The snapshot frame for the current canvas, encoded once per canvas version
+        so a burst of connections shares it.
+        """
+        etag = self.canvas.etag
+        if self._canvas_frame is None or self._canvas_frame[0] != etag:
+            self._canvas_frame = (etag, FRAME_CANVAS_SNAPSHOT + zlib.compress(
+                self.canvas.to_records(), SNAPSHOT_COMPRESSION_LEVEL
+            ))
+        return self._canvas_frame[1]
     
     async def send_canvas_state(self, websocket: WebSocket):
-        await websocket.send_json({
-            "type": "canvas_state",
-            "data": self.canvas_state
-        })
-    
-    async def broadcast_pixel_update(self, x: int, y: int, color: str):
-        if not self._is_valid_coordinate(x, y):
-            print(f"Invalid pixel coordinates: ({x}, {y})")
+        await websocket.send_bytes(self._canvas_state_frame())
+    
+    def _start_sender(self, websocket: WebSocket):
+        if websocket in self.sender_tasks:
             return
-        
-        # Update canvas state
-        coord_key = f"{x},{y}"
-        self.canvas_state[coord_key] = color
-        
-        # Debug active connections before broadcasting
-        print(f"Broadcasting pixel update: ({x}, {y}) -> {color}")
-        print(f"Active connections before broadcast: {len(self.active_connections)}")
-        print(f"Active connection IDs: {list(self.active_connections.keys())}")
-        print(f"Canvas state now has {len(self.canvas_state)} pixels")
-        
-        # Broadcast to all connected clients
-        message = {
-            "type": "pixel_update",
-            "data": {
-                "x": x,
-                "y": y,
-                "color": color
-            }
-        }
-        
-        # If no active connections, log a warning
-        if len(self.active_connections) == 0:
-            print("WARNING: No active connections to broadcast to!")
+        queue = asyncio.Queue(maxsize=settings.WS_SEND_QUEUE_SIZE)
+        self.send_queues[websocket] = queue
+        self.sender_tasks[websocket] = asyncio.create_task(self._sender(websocket, queue))
+    
+    def _stop_sender(self, websocket: WebSocket):
+        self.send_queues.pop(websocket, None)
+        task = self.sender_tasks.pop(websocket, None)
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+    
+    def _drop_client(self, websocket: WebSocket):
+        """
+        Forget a client whose queue is full or whose socket failed.
+        Its receive loop notices the closed socket and finishes the cleanup.
+        """
+        self._stop_sender(websocket)
+        if websocket in self.active_connections:
+            self.active_connections.discard(websocket)
+            logger.warning("Dropping slow or disconnected client: %s. Remaining connections: %s", id(websocket), len(self.active_connections))
+            asyncio.create_task(self._close_quietly(websocket))
+    
+    async def _close_quietly(self, websocket: WebSocket):
+        try:
+            await websocket.close()
+        except Exception:
+            pass
+    
+    def _enqueue(self, websocket: WebSocket, payload: Union[str, bytes]):
+        queue = self.send_queues.get(websocket)
+        if queue is None:
             return
-        
-        # Make a copy of the active connections to avoid modification during iteration
-        active_connections = list(self.active_connections.items())
-        print(f"Broadcasting pixel update to {len(active_connections)} clients: ({x}, {y}) -> {color}")
-        
-        disconnected_clients = []
-        
-        for client_id, connection in active_connections:
+        try:
+            queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            logger.warning("Send queue full for client %s", id(websocket))
+            self._drop_client(websocket)
+    
+    def _broadcast(self, payload: Union[str, bytes]):
+        """
+        Queue the same already-encoded frame for every client.
+        """
+        # Copy the keys since a full queue removes the client
+        for websocket in list(self.send_queues):
+            self._enqueue(websocket, payload)
+    
+    async def _sender(self, websocket: WebSocket, queue: asyncio.Queue):
+        """
+        Send a client's queued frames in order.
+        """
+        try:
+            while True:
+                payload = await queue.get()
+                if isinstance(payload, bytes):
+                    await websocket.send_bytes(payload)
+                else:
+                    await websocket.send_text(payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.debug("Error sending to client %s: %s", id(websocket), e)
+            if self.sender_tasks.get(websocket) is asyncio.current_task():
+                self._drop_client(websocket)
+    
+    def _schedule_flush(self):
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(
+                settings.WS_BATCH_WINDOW_MS / 1000, self._flush_pixels
+            )
+    
+    def _flush_pixels(self):
+        """
+        Broadcast the pixels collected during the batch window as one message.
+        """
+        if self._flush_handle is not None:
+            # Flushed early because the batch filled up
+            self._flush_handle.cancel()
+        self._flush_handle = None
+        pixels = self.pending_pixels
+        self.pending_pixels = {}
+        if not pixels:
+            return
+        self._broadcast(FRAME_PIXEL_UPDATES + b"".join(
+            PIXEL_RECORD.pack(key >> 16, key & 0xFFFF, packed) for key, packed in pixels.items()
+        ))
+    
+    def enqueue_pixel_update(self, x: int, y: int, color: str):
+        """
+        Record a pixel in the canvas state and queue it for every connected client.
+        Never waits on the network, so callers don't depend on the slowest peer.
+        """
+        self.enqueue_pixel_batch([(x, y, color)])
+    
+    def enqueue_pixel_batch(self, pixels: List[Tuple[int, int, str]]):
+        """
+        Record several (x, y, color) pixels and queue them for every connected client.
+        Updates arriving within WS_BATCH_WINDOW_MS of each other go out as one message.
+        """
+        # Bounds checked inline against locals; this runs for every pixel placed
+        width, height = self.canvas.width, self.canvas.height
+        xs, ys, values = [], [], []
+        for x, y, color in pixels:
+            if not (0 <= x < width and 0 <= y < height):
+                logger.debug("Invalid pixel coordinates: (%s, %s)", x, y)
+                continue
             try:
-                await connection.send_json(message)
-                print(f"Successfully sent update to client {client_id}")
-            except Exception as e:
-                print(f"Error broadcasting to client {client_id}: {e}")
-                disconnected_clients.append(client_id)
+                packed = pack_color(color)
+            except ValueError as e:
+                logger.debug("Invalid pixel color: %s", e)
+                continue
+            xs.append(x)
+            ys.append(y)
+            values.append(packed)
+            # Only the latest color per coordinate needs to go out; an int key hashes
+            # without building a string per pixel
+            self.pending_pixels[(x << 16) | y] = packed
+        # Write the whole batch into the canvas with one array assignment
+        self.canvas.set_packed(xs, ys, values)
         
-        # Clean up disconnected clients
-        for client_id in disconnected_clients:
-            if client_id in self.active_connections:
-                print(f"Removing disconnected client: {client_id}")
-                del self.active_connections[client_id]
-                print(f"Remaining connections after cleanup: {len(self.active_connections)}")
-                print(f"Remaining connection IDs: {list(self.active_connections.keys())}")
+        # If no active connections, there is no one to send the pixels to
+        if len(self.send_queues) == 0:
+            self.pending_pixels = {}
+            return
+        
+        if len(self.pending_pixels) >= settings.WS_BATCH_MAX_PIXELS:
+            # Don't let a burst grow one frame without bound; send what we have now
+            self._flush_pixels()
+        elif self.pending_pixels:
+            self._schedule_flush()
     
     async def broadcast_canvas_update(self):
         """
         Broadcast the entire canvas state to all connected clients.
         This is used when the canvas is wiped or needs a full refresh.
         """
-        print(f"Broadcasting full canvas update to all clients")
-        
-        # If no active connections, log a warning
+        # If no active connections, there is no one to send the canvas to
         if len(self.active_connections) == 0:
-            print("WARNING: No active connections to broadcast to!")
             return
         
         # Note: We no longer clear the canvas state here
         # This ensures we don't lose pixels when broadcasting updates
-        print(f"Broadcasting canvas state with {len(self.canvas_state)} pixels")
-        
-        # Prepare the message
-        message = {
-            "type": "canvas_state",
-            "data": self.canvas_state
-        }
+        logger.debug("Broadcasting canvas state to %s clients", len(self.active_connections))
         
-        # Make a copy of the active connections to avoid modification during iteration
-        active_connections = list(self.active_connections.items())
-        print(f"Broadcasting canvas update to {len(active_connections)} clients")
-        print(f"Active connection IDs: {list(self.active_connections.keys())}")
+        # The full state supersedes any pixels still waiting for the batch window
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        self.pending_pixels = {}
         
-        disconnected_clients = []
-        
-        for client_id, connection in active_connections:
-            try:
-                print(f"Sending canvas update to client {client_id}")
-                await connection.send_json(message)
-                print(f"Successfully sent canvas update to client {client_id}")
-            except Exception as e:
-                print(f"Error broadcasting to client {client_id}: {e}")
-                disconnected_clients.append(client_id)
-        
-        # Clean up disconnected clients
-        for client_id in disconnected_clients:
-            if client_id in self.active_connections:
-                print(f"Removing disconnected client: {client_id}")
-                del self.active_connections[client_id]
-                print(f"Remaining connections after cleanup: {len(self.active_connections)}")
-                print(f"Remaining connection IDs: {list(self.active_connections.keys())}")
+        self._broadcast(self._canvas_state_frame())
     
     async def handle_connection(self, websocket: WebSocket):
-        client_id = str(id(websocket))  # Convert to string for better stability
+        client_id = id(websocket)  # Only used to tell clients apart in the logs
         try:
             # Ensure the connection is in active_connections
-            if client_id not in self.active_connections:
-                print(f"Adding client {client_id} to active_connections")
-                self.active_connections[client_id] = websocket
-                print(f"Total active connections: {len(self.active_connections)}")
-                print(f"Active connection IDs: {list(self.active_connections.keys())}")
+            if websocket not in self.active_connections:
+                logger.debug("Adding client %s to active_connections", client_id)
+                self.active_connections.add(websocket)
+                self._start_sender(websocket)
             
             while True:
                 try:
-                    # Use a timeout to detect disconnections
-                    data = await asyncio.wait_for(websocket.receive_json(), timeout=30.0)
-                    print(f"Received message from client {client_id}: {data}")
+                    # uvicorn's protocol pings close dead sockets, which surfaces here as WebSocketDisconnect
+                    raw = await websocket.receive_text()
+                    if len(raw) > MAX_CLIENT_MESSAGE_BYTES:
+                        logger.debug("Message from client %s too large: %s bytes", client_id, len(raw))
+                        await websocket.close(code=1009)  # Message too big
+                        break
+                    data = orjson.loads(raw)
+                    logger.debug("Received message from client %s: %s", client_id, data)
                     
                     if data["type"] == "pixel_update":
-                        x = data["data"]["x"]
-                        y = data["data"]["y"]
-                        color = data["data"]["color"]
-                        
-                        # Validate pixel placement
-                        if self._is_valid_coordinate(x, y):
-                            await self.broadcast_pixel_update(x, y, color)
+                        # Pixels are only placed through the paid API routes; the canvas mirrors
+                        # the database, so unpaid client updates are ignored
+                        logger.debug("Ignoring pixel_update from client %s", client_id)
                     elif data["type"] == "ping":
-                        # Respond to ping messages to keep the connection alive
-                        await websocket.send_json({"type": "pong"})
-                        print(f"Sent pong to client {client_id}")
-                
-                except asyncio.TimeoutError:
-                    # Send a ping to check if the connection is still alive
-                    try:
-                        print(f"Sending ping to client {client_id}")
-                        await websocket.send_json({"type": "ping"})
-                    except Exception as e:
-                        # If we can't send a ping, the connection is dead
-                        print(f"Connection to client {client_id} timed out: {e}")
-                        break
+                        # Browsers can't send protocol pings, so the frontend checks liveness with these
+                        self._enqueue(websocket, PONG)
                         
                 except WebSocketDisconnect:
-                    print(f"WebSocket client {client_id} disconnected")
+                    logger.debug("WebSocket client %s disconnected", client_id)
                     break
                     
                 except Exception as e:
-                    print(f"Error handling message from client {client_id}: {e}")
+                    logger.debug("Error handling message from client %s: %s", client_id, e)
                     # Check if the error indicates a disconnection
                     if "disconnect" in str(e).lower() or "closed" in str(e).lower():
-                        print(f"Client {client_id} appears to be disconnected")
+                        logger.debug("Client %s appears to be disconnected", client_id)
                         break
                     # Otherwise, continue to the next message
         
         except Exception as e:
-            print(f"Unexpected error in handle_connection for client {client_id}: {e}")
+            logger.error("Unexpected error in handle_connection for client %s: %s", client_id, e)
         
         # Always clean up the connection when we exit the loop
-        print(f"Cleaning up connection for client {client_id}")
         await self.disconnect(websocket)
-    
-    def _is_valid_coordinate(self, x: int, y: int) -> bool:
-        return (0 <= x < settings.CANVAS_WIDTH and 
-                0 <= y < settings.CANVAS_HEIGHT) 
\ No newline at end of file
@@ -139,7 +139,9 @@ export function WalletProvider({ children }: { children: ReactNode }) {
       // Use the direct window.kasware object as per the documentation
       if (window.kasware) {
         // Ensure the amount is a number and not a string or other type
-        const txId = await window.kasware.sendKaspa(toAddress, adjustedSompiAmount, txOptions)
+        const result = await window.kasware.sendKaspa(toAddress, adjustedSompiAmount, txOptions)
+        // Some KasWare versions return the whole transaction as JSON; the backend only accepts the bare ID
+        const txId = typeof result === "string" && result.trim().startsWith("{") ? JSON.parse(result).id : result
         console.log("Transaction sent with ID:", txId)
         return txId
       } else {
@@ -3,14 +3,16 @@
 import { useState, useEffect, useCallback } from 'react'
 
 // Define types for API responses
+// GET /pixels without filters returns only x, y and color; the other fields
+// come with the filtered (bounding box / since) form
 export interface PixelData {
-  id: number;
+  id?: number;
   x: number;
   y: number;
   color: string;
-  wallet_address: string;
-  transaction_id: string;
-  created_at: string;
+  wallet_address?: string;
+  transaction_id?: string;
+  created_at?: string;
 }
 
 export interface ConfigData {
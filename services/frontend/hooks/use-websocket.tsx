@@ -7,6 +7,25 @@ interface WebSocketMessage {
   data: any;
 }
 
+// Binary frames start with a kind byte, followed by little-endian records of
+// x (uint16), y (uint16) and color (uint32 0xRRGGBBAA), 8 bytes each.
+// Pixel updates are applied on top of the canvas; a snapshot replaces it and
+// its records are zlib-compressed.
+const FRAME_PIXEL_UPDATES = 0
+const FRAME_CANVAS_SNAPSHOT = 1
+const PIXEL_RECORD_SIZE = 8
+
+async function inflate(data: ArrayBuffer): Promise<ArrayBuffer> {
+  const stream = new Blob([data]).stream().pipeThrough(new DecompressionStream('deflate'))
+  return new Response(stream).arrayBuffer()
+}
+
+// Same format as the backend's color strings: "#rrggbb", or "#rrggbbaa" when not opaque
+function unpackColor(packed: number): string {
+  const hex = packed.toString(16).padStart(8, '0')
+  return hex.endsWith('ff') ? `#${hex.slice(0, 6)}` : `#${hex}`
+}
+
 export function useWebSocket(url: string) {
   const [isConnected, setIsConnected] = useState(false)
   const [canvasState, setCanvasState] = useState<Record<string, string>>({})
@@ -15,6 +34,8 @@ export function useWebSocket(url: string) {
   const reconnectTimeoutRef = useRef<NodeJS.Timeout | null>(null)
   const pingIntervalRef = useRef<NodeJS.Timeout | null>(null)
   const lastPongRef = useRef<number>(Date.now())
+  // Binary frames are applied one after another, so updates never land before a snapshot still being inflated
+  const frameChainRef = useRef<Promise<void>>(Promise.resolve())
 
   useEffect(() => {
     const connectWebSocket = () => {
@@ -53,6 +74,7 @@ export function useWebSocket(url: string) {
         console.log(`Connecting to WebSocket: ${wsUrl}`);
         
         const socket = new WebSocket(wsUrl)
+        socket.binaryType = 'arraybuffer'
 
         socket.onopen = () => {
           console.log('WebSocket connected')
@@ -113,24 +135,44 @@ export function useWebSocket(url: string) {
 
         socket.onmessage = (event) => {
           try {
+            if (event.data instanceof ArrayBuffer) {
+              const frame = event.data
+              if (frame.byteLength === 0) {
+                return
+              }
+              const kind = new DataView(frame).getUint8(0)
+              if (kind !== FRAME_PIXEL_UPDATES && kind !== FRAME_CANVAS_SNAPSHOT) {
+                return
+              }
+
+              frameChainRef.current = frameChainRef.current.then(async () => {
+                const records = kind === FRAME_CANVAS_SNAPSHOT ? await inflate(frame.slice(1)) : frame.slice(1)
+                const view = new DataView(records)
+                const end = Math.floor(view.byteLength / PIXEL_RECORD_SIZE) * PIXEL_RECORD_SIZE
+
+                // Apply all pixels from the frame in a single state update
+                setCanvasState((prev) => {
+                  const newState: Record<string, string> = kind === FRAME_CANVAS_SNAPSHOT ? {} : { ...prev };
+                  for (let offset = 0; offset < end; offset += PIXEL_RECORD_SIZE) {
+                    const x = view.getUint16(offset, true)
+                    const y = view.getUint16(offset + 2, true)
+                    newState[`${x},${y}`] = unpackColor(view.getUint32(offset + 4, true))
+                  }
+                  return newState;
+                })
+                if (kind === FRAME_CANVAS_SNAPSHOT) {
+                  console.log(`Received canvas snapshot with ${end / PIXEL_RECORD_SIZE} pixels`)
+                }
+              }).catch((error) => {
+                console.error('Error applying WebSocket frame:', error)
+              })
+              return
+            }
+
             const message = JSON.parse(event.data)
             console.log('Received WebSocket message:', message)
 
-            if (message.type === 'canvas_state') {
-              console.log(`Received canvas state with ${Object.keys(message.data).length} pixels`)
-              setCanvasState(message.data)
-            } else if (message.type === 'pixel_update') {
-              const { x, y, color } = message.data
-              console.log(`Received pixel update: (${x},${y}) -> ${color}`)
-              
-              // Update canvas state with the new pixel
-              setCanvasState((prev) => {
-                const newState = { ...prev };
-                newState[`${x},${y}`] = color;
-                console.log(`Updated canvas state with pixel at (${x},${y}) -> ${color}`);
-                return newState;
-              })
-            } else if (message.type === 'pong' || message.type === 'ping') {
+            if (message.type === 'pong' || message.type === 'ping') {
               // Update last pong time
               lastPongRef.current = Date.now()
               console.log('Received pong from server')